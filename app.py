@@ -1,29 +1,113 @@
 import asyncio
-from aiogram import Dispatcher
-from loader import dp, bot
-from handlers.users import start  # your handlers file
+import logging
+from aiohttp import web
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from data import config
+from loader import dp, bot, backend, browser_pool, render_client, render_queue
+from handlers.users import admin, callbacks, start  # your handlers file
+from keyboards import build_keyboards
+from middlewares import setup_middlewares
+from utils.metrics import start_metrics_server
 from utils.notify_admins import on_startup_notify
 from utils.set_bot_commands import set_default_commands
-from environs import Env
+from utils.translations import report_locales
+
+
+metrics_server: web.AppRunner = None
 
-# Optional: load environment variables (if not done in loader.py)
-env = Env()
-env.read_env()
 
 async def on_startup():
+    global metrics_server
+
+    report_locales()
+    build_keyboards()
     await set_default_commands(bot)
+    await backend.start()
+    if render_client is None:
+        await browser_pool.start()
+
+    if config.BOT_MODE == "webhook":
+        await bot.set_webhook(
+            f"{config.WEBHOOK_URL.rstrip('/')}{config.WEBHOOK_PATH}",
+            secret_token=config.WEBHOOK_SECRET or None,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+    else:
+        # getUpdates is refused while a webhook is set
+        await bot.delete_webhook()
+
+    if config.METRICS_PORT:
+        try:
+            metrics_server = await start_metrics_server(config.METRICS_HOST, config.METRICS_PORT)
+        except OSError as err:
+            # Metrics are optional: a taken port must not keep the bot down
+            logging.error(f"Metrics endpoint not started on {config.METRICS_HOST}:{config.METRICS_PORT}: {err}")
+
     await on_startup_notify(bot)
 
-async def main():
+async def on_shutdown():
+    # The webhook is left in place: other workers behind the balancer still use it
+    await render_queue.stop()
+    await browser_pool.stop()
+    if render_client is not None:
+        await render_client.close()
+    await backend.close()
+    await dp.storage.close()
+    if metrics_server is not None:
+        await metrics_server.cleanup()
+
+
+class WebhookHandler(SimpleRequestHandler):
+    async def close(self):
+        # Updates already acknowledged to Telegram are finished before anything is closed
+        tasks = self._background_feed_update_tasks
+        if tasks:
+            await asyncio.wait(tasks, timeout=config.WEBHOOK_SHUTDOWN_TIMEOUT)
+        await super().close()
+
+
+def run_webhook():
+    if not config.WEBHOOK_URL:
+        raise RuntimeError("WEBHOOK_URL is required when BOT_MODE=webhook")
+
+    app = web.Application()
+    WebhookHandler(dp, bot, secret_token=config.WEBHOOK_SECRET or None).register(
+        app, path=config.WEBHOOK_PATH
+    )
+    setup_application(app, dp, bot=bot)
+
+    logging.info("Bot started (webhook).")
+    web.run_app(app, host=config.IP, port=config.WEBHOOK_PORT)
+
+
+async def run_polling():
+    logging.info("Bot started.")
+    await dp.start_polling(
+        bot,
+        polling_timeout=config.POLLING_TIMEOUT,
+        allowed_updates=dp.resolve_used_update_types(),
+        handle_as_tasks=True,
+        tasks_concurrency_limit=config.UPDATES_CONCURRENCY or None,
+    )
+
+
+def main():
     # ✅ Register routers here
+    dp.include_router(admin.router)
     dp.include_router(start.router)
+    dp.include_router(callbacks.router)
+
+    # ✅ Anti-flood for messages and callback queries
+    setup_middlewares(dp)
 
-    # ✅ Run startup routines
-    await on_startup()
+    # ✅ Startup / shutdown routines run in both modes
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
 
-    # ✅ Start polling
-    print("Bot started.")
-    await dp.start_polling(bot)
+    if config.BOT_MODE == "webhook":
+        run_webhook()
+    else:
+        asyncio.run(run_polling())
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
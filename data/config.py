@@ -1,3 +1,5 @@
+import os
+
 from environs import Env
 
 # environs kutubxonasidan foydalanish
@@ -8,3 +10,102 @@ env.read_env()
 BOT_TOKEN = env.str("BOT_TOKEN")  # Bot toekn
 ADMINS = env.list("ADMINS")  # adminlar ro'yxati
 IP = env.str("ip")  # Xosting ip manzili
+
+# PDF render uchun Chromium pool sozlamalari
+FRONT_END_URL = env.str("FRONT_END_URL")  # natijalar sahifasi shu manzildan PDF qilinadi
+PDF_POOL_SIZE = env.int("PDF_POOL_SIZE", 2)  # bir vaqtda nechta PDF render qilinadi
+PDF_BROWSER_MAX_RENDERS = env.int("PDF_BROWSER_MAX_RENDERS", 200)  # shundan keyin brauzer qayta ishga tushadi
+
+# Natija sahifasi tayyor ekanini bildiruvchi signal (JS flag yoki selector)
+PDF_READY_FLAG = env.str("PDF_READY_FLAG", "__RESULTS_READY__")  # window.<flag> === true
+PDF_READY_SELECTOR = env.str("PDF_READY_SELECTOR", "[data-results-ready]")
+PDF_READY_TIMEOUT = env.float("PDF_READY_TIMEOUT", 4)  # sekund, signal kelmasa shuncha kutiladi
+
+# Backend API bilan ulanish sozlamalari
+BACK_END_URL = env.str("BACK_END_URL")
+BACKEND_TIMEOUT = env.float("BACKEND_TIMEOUT", 10)  # sekund
+BACKEND_LIMIT_PER_HOST = env.int("BACKEND_LIMIT_PER_HOST", 20)  # bir vaqtdagi ulanishlar soni
+BACKEND_KEEPALIVE = env.float("BACKEND_KEEPALIVE", 30)  # bo'sh ulanish necha sekund saqlanadi
+BACKEND_DNS_TTL = env.int("BACKEND_DNS_TTL", 300)  # DNS javobi necha sekund keshlanadi
+
+# FSM (foydalanuvchi holati) qayerda saqlanadi: sqlite, redis yoki memory
+FSM_STORAGE = env.str("FSM_STORAGE", "sqlite")
+FSM_SQLITE_PATH = env.str("FSM_SQLITE_PATH", "data/fsm.sqlite3")
+REDIS_URL = env.str("REDIS_URL", "redis://localhost:6379/0")
+FSM_TTL = env.int("FSM_TTL", 30 * 24 * 3600)  # faol bo'lmagan foydalanuvchi holati necha sekunddan keyin o'chadi (0 - o'chmaydi)
+
+# Shifokorlar va qabul turlari ro'yxati keshi
+CATALOG_CACHE_TTL = env.int("CATALOG_CACHE_TTL", 300)  # sekund
+CATALOG_CACHE_SIZE = env.int("CATALOG_CACHE_SIZE", 512)  # nechta sahifa saqlanadi
+
+# Katta PDF fayllar xotira o'rniga vaqtinchalik faylga (tmpfs) yoziladi
+PDF_SPILL_THRESHOLD = env.int("PDF_SPILL_THRESHOLD", 0)  # bayt, 0 - har doim xotiradan yuboriladi
+PDF_SPILL_DIR = env.str("PDF_SPILL_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else None)
+
+# Tayyor PDF natijalar keshi (disk + Telegram file_id)
+PDF_CACHE_DIR = env.str("PDF_CACHE_DIR", "data/pdf_cache")
+PDF_CACHE_MAX_MB = env.int("PDF_CACHE_MAX_MB", 200)  # diskdagi PDF fayllar hajmi chegarasi
+PDF_CACHE_TTL = env.int("PDF_CACHE_TTL", 300)  # sekund, natija shundan keyin qayta render qilinadi; o'zgargan natijani darhol yangilash: /clear_results
+
+# PDF render navbati
+RENDER_WORKERS = env.int("RENDER_WORKERS", PDF_POOL_SIZE)  # bir vaqtda nechta PDF tayyorlanadi
+RENDER_QUEUE_MAX = env.int("RENDER_QUEUE_MAX", 20)  # navbatda kutayotganlar chegarasi, undan ko'pi "band" javobini oladi
+
+# Alohida render_worker.py jarayonlari (unix:/yo'l/socket yoki http://host:port, vergul bilan)
+RENDER_WORKER_URLS = env.list("RENDER_WORKER_URLS", [])  # bo'sh bo'lsa PDF bot jarayonining o'zida tayyorlanadi
+RENDER_WORKER_TIMEOUT = env.float("RENDER_WORKER_TIMEOUT", 60)  # sekund
+
+# Yangilanishlarni qabul qilish usuli: polling yoki webhook
+BOT_MODE = env.str("BOT_MODE", "polling")
+WEBHOOK_URL = env.str("WEBHOOK_URL", "")  # tashqi manzil, masalan https://bot.example.com
+WEBHOOK_PATH = env.str("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = env.str("WEBHOOK_SECRET", "")  # Telegram X-Telegram-Bot-Api-Secret-Token sarlavhasida yuboradi
+WEBHOOK_PORT = env.int("WEBHOOK_PORT", 8080)  # server IP manzilida shu portni tinglaydi
+WEBHOOK_SHUTDOWN_TIMEOUT = env.float("WEBHOOK_SHUTDOWN_TIMEOUT", 30)  # to'xtashda ishlanayotgan yangilanishlar necha sekund kutiladi
+
+# Polling sozlamalari
+POLLING_TIMEOUT = env.int("POLLING_TIMEOUT", 30)  # getUpdates long-polling, sekund
+UPDATES_CONCURRENCY = env.int("UPDATES_CONCURRENCY", 64)  # bir vaqtda ishlanadigan yangilanishlar soni (0 - cheklanmagan); bitta foydalanuvchiniki navbat bilan
+UPDATES_PER_USER = env.int("UPDATES_PER_USER", 3)  # bitta foydalanuvchining navbatdagi yangilanishlari soni, ortig'i tashlab yuboriladi (0 - cheklanmagan)
+
+# Anti-flood: har bir foydalanuvchi uchun umumiy chegara
+THROTTLE_RATE = env.float("THROTTLE_RATE", 0.5)  # sekund, bitta so'rov uchun
+THROTTLE_BURST = env.int("THROTTLE_BURST", 5)  # ketma-ket ruxsat etilgan so'rovlar
+
+# Qabul vaqtlari: ish kuni va bitta slot uzunligi
+WORK_DAY_START = env.str("WORK_DAY_START", "08:00")
+WORK_DAY_END = env.str("WORK_DAY_END", "18:00")  # oxirgi slot shu vaqtda tugaydi
+SLOT_MINUTES = env.int("SLOT_MINUTES", 30)
+
+# Shifokor kunlik jadvali keshi va eng yaqin bo'sh vaqt qidiruvi
+TIMETABLE_CACHE_TTL = env.int("TIMETABLE_CACHE_TTL", 60)  # sekund
+TIMETABLE_CACHE_SIZE = env.int("TIMETABLE_CACHE_SIZE", 2048)  # nechta (shifokor, kun) saqlanadi
+NEXT_FREE_DAYS = env.int("NEXT_FREE_DAYS", 14)  # necha kun oldinga qidiriladi
+NEXT_FREE_COUNT = env.int("NEXT_FREE_COUNT", 6)  # nechta bo'sh vaqt taklif qilinadi
+
+# Backend so'rovlarini qayta urinish, circuit breaker va hedging
+BACKEND_RETRIES = env.int("BACKEND_RETRIES", 2)  # GET so'rovlar uchun qo'shimcha urinishlar
+BACKEND_RETRY_BACKOFF = env.float("BACKEND_RETRY_BACKOFF", 0.2)  # sekund, har urinishda ikki barobar (tasodifiy)
+BACKEND_BREAKER_THRESHOLD = env.int("BACKEND_BREAKER_THRESHOLD", 5)  # ketma-ket xatolardan keyin endpoint vaqtincha yopiladi
+BACKEND_BREAKER_RESET = env.float("BACKEND_BREAKER_RESET", 30)  # sekund, shundan keyin bitta sinov so'rovi yuboriladi
+# "METHOD /yo'l/" prefiksi bo'yicha, masalan: GET /api/patient/=3,POST /api/admittance/=20
+BACKEND_TIMEOUTS = env.dict("BACKEND_TIMEOUTS", {"GET /api/patient/": 3, "POST /api/admittance/": 20})
+BACKEND_HEDGE = env.dict("BACKEND_HEDGE", {})  # masalan GET /api/doctor-timetable/=1.5 - sekin javobga ikkinchi so'rov
+
+# Qabulni saqlash: bir xil savat takror yuborilganda bitta so'rov ishlatiladi
+ADMITTANCE_IDEMPOTENCY_TTL = env.int("ADMITTANCE_IDEMPOTENCY_TTL", 10)  # sekund, takroriy bosishlar shu oraliqda bitta so'rovga birlashadi
+ADMITTANCE_LOCK_TTL = env.int("ADMITTANCE_LOCK_TTL", 60)  # sekund, bir foydalanuvchi bir vaqtda bitta qabul yuboradi
+
+# Telefon raqami bo'yicha topilgan bemorlar keshi
+PATIENT_CACHE_TTL = env.int("PATIENT_CACHE_TTL", 900)  # sekund
+PATIENT_CACHE_SIZE = env.int("PATIENT_CACHE_SIZE", 4096)  # nechta raqam saqlanadi
+
+# Loglar: "json" yoki "text"; modul bo'yicha daraja, masalan: aiogram.event=WARNING,utils.backend=DEBUG
+LOG_FORMAT = env.str("LOG_FORMAT", "json")
+LOG_LEVEL = env.str("LOG_LEVEL", "INFO")
+LOG_LEVELS = env.dict("LOG_LEVELS", {"aiogram.event": "WARNING"})
+
+# Prometheus metrikalari: http://METRICS_HOST:METRICS_PORT/metrics (0 - o'chirilgan), masalan 9464
+METRICS_HOST = env.str("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = env.int("METRICS_PORT", 0)
+ACTIVE_USERS_WINDOW = env.int("ACTIVE_USERS_WINDOW", 300)  # sekund, shu vaqt ichida yozgan foydalanuvchilar "faol"
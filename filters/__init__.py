@@ -1,7 +1,7 @@
 from aiogram import Dispatcher
 
 from loader import dp
-# from .is_admin import AdminFilter
+from .is_admin import AdminFilter
 
 
 if __name__ == "filters":
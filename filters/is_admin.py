@@ -0,0 +1,9 @@
+from aiogram.filters import BaseFilter
+from aiogram.types import Message
+
+from data.config import ADMINS
+
+
+class AdminFilter(BaseFilter):
+    async def __call__(self, message: Message) -> bool:
+        return message.from_user is not None and str(message.from_user.id) in ADMINS
@@ -1,3 +1,5 @@
+from . import admin
+from . import callbacks
 from . import help
 from . import start
 # from . import echo
\ No newline at end of file
@@ -0,0 +1,32 @@
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+
+from filters.is_admin import AdminFilter
+from loader import catalog_cache, pdf_cache
+
+router = Router()
+router.message.filter(AdminFilter())
+
+
+@router.message(Command("clear_cache"))
+async def clear_cache(message: Message):
+    catalog_cache.clear()
+    await message.answer("Kesh tozalandi")
+
+
+@router.message(Command("clear_results"))
+async def clear_results(message: Message, command: CommandObject):
+    """
+    /clear_results <guid> - bitta natijani,
+    /clear_results services <id>,<id> - shu xizmatlar kirgan natijalarni,
+    /clear_results - hammasini o'chiradi
+    """
+    args = (command.args or "").split()
+    if args[:1] == ["services"] and len(args) == 2:
+        await pdf_cache.invalidate_results(service_ids=args[1].split(","))
+    elif args:
+        await pdf_cache.invalidate_results(guid=args[0])
+    else:
+        await pdf_cache.clear()
+    await message.answer("Natijalar keshi tozalandi")
@@ -0,0 +1,346 @@
+from datetime import datetime
+
+from aiogram import Router
+from aiogram.fsm.context import FSMContext
+from aiogram.types import CallbackQuery
+from aiogram_calendar import SimpleCalendar, SimpleCalendarCallback
+from aiogram_calendar.schemas import SimpleCalAct
+
+from handlers.users.start import (
+    handle_code,
+    handle_fetch_admittanceType,
+    handle_fetch_doctors,
+    handle_fetch_services,
+    handle_language_request,
+    handle_next_free_slots,
+    handle_open_cart,
+    handle_patient,
+    handle_post_admittance,
+    process_confirmation,
+    process_patient_add_confirmation,
+    select_registration_date,
+)
+from keyboards.inline.callbacks import (
+    AdmittanceTypeCallback,
+    DoctorCallback,
+    HourCallback,
+    LanguageCallback,
+    PageCallback,
+    PrintServiceCallback,
+    SlotCallback,
+)
+from keyboards.inline.main import get_add_service_keyboard, get_admission_calendar, get_confirm_keyboard
+from utils.callback_dispatcher import CallbackDispatcher
+from utils.helpers import get_full_name, get_safe_attribute, get_translation
+from utils.misc import rate_limit
+
+router = Router()
+callbacks = CallbackDispatcher()
+
+
+def resolve_action(callback: CallbackQuery):
+    # Lets ThrottlingMiddleware apply the limit of the action that will run
+    return callbacks.resolve(callback.data)[0]
+
+
+@router.callback_query(flags={"resolve_action": resolve_action})
+async def handle_callback(callback: CallbackQuery, state: FSMContext):
+    handler, callback_data = callbacks.resolve(callback.data)
+    if handler is None:
+        await callback.answer()
+        return
+
+    data = await state.get_data()
+    await handler(callback, state, data, callback_data)
+
+
+@callbacks.factory(LanguageCallback)
+async def select_language(callback: CallbackQuery, state: FSMContext, data, callback_data: LanguageCallback):
+    await state.update_data(language=callback_data.code)
+    await callback.answer()
+    await handle_patient(callback.message, state)
+
+
+@callbacks.action("confirm_yes", "confirm_no")
+async def confirm(callback: CallbackQuery, state: FSMContext, data, callback_data=None):
+    await callback.message.delete()
+    await callback.answer()
+
+    if data.get("step") == "service_confirm":
+        await confirm_service(callback, state, data)
+    elif data.get("add_patient", False):
+        await process_patient_add_confirmation(callback, state)
+    else:
+        await process_confirmation(callback, state)
+
+
+async def confirm_service(callback: CallbackQuery, state: FSMContext, data):
+    lang = data.get("language", "ru")
+
+    if callback.data == "confirm_yes":
+        cart = data.get("cart", [])
+        cart.append(data.get("service", {}))
+        await state.update_data(service={}, step="", cart=cart)
+        await callback.message.answer(f"{get_translation(lang, 'added_to_cart')}")
+    else:
+        await state.update_data(service={}, step="")
+        await callback.message.answer(f"{get_translation(lang, 'canceled')}")
+
+    await handle_open_cart(callback, state)
+
+
+@callbacks.action("come_back_add_service")
+async def come_back_add_service(callback: CallbackQuery, state: FSMContext, data, callback_data=None):
+    await callback.message.delete()
+    await callback.answer()
+    lang = data.get("language", "ru")
+    add_service_text = get_translation(lang, "add_serv")
+    add_service_kb = get_add_service_keyboard(lang)
+    await callback.message.answer(add_service_text, reply_markup=add_service_kb)
+
+
+@callbacks.factory(SimpleCalendarCallback)
+async def select_calendar_date(callback: CallbackQuery, state: FSMContext, data, callback_data: SimpleCalendarCallback):
+    if callback_data.act == SimpleCalAct.cancel:
+        await callback.message.delete()
+        await callback.answer()
+        await handle_fetch_doctors(callback.message, state)
+        return
+
+    if callback_data.act == SimpleCalAct.today:
+        await callback.message.delete()
+        await callback.answer()
+        await select_registration_date(callback.message, state, data, datetime.now())
+        return
+
+    selected, date = await SimpleCalendar().process_selection(callback, callback_data)
+    if not selected:
+        return
+
+    await callback.message.delete()
+    await callback.answer()
+
+    if date.date() < datetime.now().date() or date.date().weekday() == 6:
+        lang = data.get("language", "ru")
+        await callback.message.answer(
+            f"{get_translation(lang, 'uncorrect_date')}\n{get_translation(lang, 'select_admission_date')}",
+            reply_markup=await get_admission_calendar(lang),
+        )
+        return
+
+    await select_registration_date(callback.message, state, data, date)
+
+
+@callbacks.action("today")
+async def select_today(callback: CallbackQuery, state: FSMContext, data, callback_data=None):
+    if data.get("step") != "registrationDate":
+        await callback.answer()
+        return
+
+    await callback.message.delete()
+    await callback.answer()
+    await select_registration_date(callback.message, state, data, datetime.now())
+
+
+@callbacks.action("change_lang")
+async def change_language(callback: CallbackQuery, state: FSMContext, data, callback_data=None):
+    await callback.message.delete()
+    await callback.answer()
+    await handle_language_request(callback.message, state)
+
+
+@callbacks.action("save_admittance")
+@rate_limit(5)
+async def save_admittance(callback: CallbackQuery, state: FSMContext, data, callback_data=None):
+    await callback.message.delete()
+    await callback.answer()
+    await handle_post_admittance(callback.message, state)
+
+
+@callbacks.action("clear_cart")
+async def clear_cart(callback: CallbackQuery, state: FSMContext, data, callback_data=None):
+    await callback.message.delete()
+    await callback.answer()
+    await state.update_data(cart=[])
+    await handle_open_cart(callback, state, get_translation(data.get("language", "ru"), "cart_cleared"))
+
+
+@callbacks.action("come_back")
+async def come_back(callback: CallbackQuery, state: FSMContext, data, callback_data=None):
+    await callback.message.delete()
+    await callback.answer()
+    await state.update_data(selected_services_print=[])
+    await handle_patient(callback.message, state)
+
+
+@callbacks.action("print_results")
+@rate_limit(10, key="pdf", burst=2)
+async def print_results(callback: CallbackQuery, state: FSMContext, data, callback_data=None):
+    await callback.message.delete()
+    await callback.answer()
+    await handle_code(callback.message, state, customCode=None, service=True)
+    await state.update_data(selected_services_print=[])
+    await handle_patient(callback.message, state)
+
+
+@callbacks.factory(PrintServiceCallback)
+async def toggle_print_service(callback: CallbackQuery, state: FSMContext, data, callback_data: PrintServiceCallback):
+    await callback.message.delete()
+    await callback.answer()
+
+    service_id = str(callback_data.id)
+    selected_services = data.get("selected_services_print", [])
+
+    if service_id in selected_services:
+        selected_services.remove(service_id)
+    else:
+        selected_services.append(service_id)
+
+    await state.update_data(selected_services_print=selected_services)
+
+    # Redraw the list from the services kept in state
+    await handle_fetch_services(callback.message, state, True)
+
+
+@callbacks.factory(HourCallback)
+async def select_hour(callback: CallbackQuery, state: FSMContext, data, callback_data: HourCallback):
+    await callback.message.delete()
+    await callback.answer()
+
+    service = data.get("service", {})
+    registration_date = datetime.strptime(service.get("registration_date", ""), "%Y-%m-%d")
+    service['registrationDate'] = registration_date.replace(
+        hour=callback_data.hour, minute=callback_data.minute
+    ).isoformat()
+
+    await state.update_data(service=service)
+    await handle_fetch_admittanceType(callback.message, state)
+
+
+@callbacks.action("next_free")
+@rate_limit(3, burst=2)
+async def next_free_slots(callback: CallbackQuery, state: FSMContext, data, callback_data=None):
+    await callback.message.delete()
+    await callback.answer()
+    await handle_next_free_slots(callback.message, state)
+
+
+@callbacks.factory(SlotCallback)
+async def select_free_slot(callback: CallbackQuery, state: FSMContext, data, callback_data: SlotCallback):
+    await callback.message.delete()
+    await callback.answer()
+
+    service = data.get("service", {})
+    start = datetime.strptime(callback_data.day, "%Y%m%d").replace(
+        hour=callback_data.hour, minute=callback_data.minute
+    )
+    service['registration_date'] = start.strftime("%Y-%m-%d")
+    service['registrationDate'] = start.isoformat()
+
+    await state.update_data(service=service, step="")
+    await handle_fetch_admittanceType(callback.message, state)
+
+
+@callbacks.factory(DoctorCallback)
+async def select_doctor(callback: CallbackQuery, state: FSMContext, data, callback_data: DoctorCallback):
+    await callback.message.delete()
+    await callback.answer()
+
+    service = data.get("service", {})
+    current_doctor = next(
+        (doctor for doctor in data.get("fetched_doctors", []) if str(doctor["id"]) == str(callback_data.id)),
+        None,
+    )
+    if current_doctor is None:
+        # Button from a list that is no longer in state
+        await handle_fetch_doctors(callback.message, state)
+        return
+
+    service['doctor'] = current_doctor['id']
+    service['doctor_obj'] = current_doctor
+    await state.update_data(service=service, step="registrationDate")
+
+    lang = data.get("language", "ru")
+    await callback.message.answer(
+        f"{get_translation(lang, 'select_admission_date')}",
+        reply_markup=await get_admission_calendar(lang),
+    )
+
+
+@callbacks.factory(AdmittanceTypeCallback)
+async def select_admittance_type(callback: CallbackQuery, state: FSMContext, data, callback_data: AdmittanceTypeCallback):
+    await callback.message.delete()
+    await callback.answer()
+
+    lang = data.get("language", "ru")
+    service = data.get("service", {})
+    current_admType = next(
+        (adm_type for adm_type in data.get("fetched_admittanceType", []) if str(adm_type["id"]) == str(callback_data.id)),
+        None,
+    )
+    if current_admType is None:
+        await handle_fetch_admittanceType(callback.message, state)
+        return
+
+    service['admittanceType'] = current_admType['id']
+    service['admittanceType_obj'] = current_admType
+    await state.update_data(service=service, step="service_confirm")
+    confirm_kb = get_confirm_keyboard(lang)
+
+    message_text = f"<b>{get_translation(lang, 'is_correct')}</b>\n{get_translation(lang, 'doctor')}: {get_full_name(service.get('doctor_obj', {}))}\n{get_translation(lang, 'admittanceType')}: {get_safe_attribute(service, 'admittanceType_obj.title')} - <b>{float(get_safe_attribute(service, 'admittanceType_obj.amount'))}</b> \n{get_translation(lang, 'time')}: {service.get('registrationDate', '')}"
+
+    await callback.message.answer(f"{message_text}", reply_markup=confirm_kb)
+
+
+@callbacks.action("male", "female")
+async def select_gender(callback: CallbackQuery, state: FSMContext, data, callback_data=None):
+    await callback.message.delete()
+    await callback.answer()
+
+    patient_form = data.get("patient_form", {})
+    patient_form["gender"] = 1 if callback.data == "male" else 2
+
+    await state.update_data(patient_form=patient_form, step="birthday")
+    await callback.message.answer(f"{get_translation(data.get('language', 'ru'), 'select_birthday')}")
+
+
+@callbacks.action("cart")
+async def open_cart(callback: CallbackQuery, state: FSMContext, data, callback_data=None):
+    await callback.message.delete()
+    await callback.answer()
+    await handle_open_cart(callback, state)
+
+
+@callbacks.action("add_service")
+@rate_limit(1, burst=3)
+async def add_service(callback: CallbackQuery, state: FSMContext, data, callback_data=None):
+    await callback.message.delete()
+    await callback.answer()
+    await state.update_data(service={}, limit=10, offset=0, count=0)
+    await handle_fetch_doctors(callback.message, state)
+
+
+@callbacks.factory(PageCallback)
+@rate_limit(1, burst=3)
+async def change_page(callback: CallbackQuery, state: FSMContext, data, callback_data: PageCallback):
+    await callback.message.delete()
+    await callback.answer()
+
+    offset = data.get("offset", 0) + callback_data.step * data.get("limit", 10)
+    await state.update_data(offset=offset)
+
+    if callback_data.target == "doctor":
+        await handle_fetch_doctors(callback.message, state)
+    else:
+        await handle_fetch_admittanceType(callback.message, state)
+
+
+@callbacks.fallback
+@rate_limit(10, key="pdf", burst=2)
+async def result_code(callback: CallbackQuery, state: FSMContext, data, callback_data=None):
+    # Admittance code buttons carry the bare number as their data
+    if not callback.data.isdigit():
+        await callback.answer()
+        return
+
+    await handle_code(callback.message, state, callback.data)
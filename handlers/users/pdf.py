@@ -1,35 +1,89 @@
 import asyncio
-
-from environs import Env
-from playwright.async_api import async_playwright
+import logging
+import os
+import tempfile
 import time
+from contextlib import asynccontextmanager
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import BufferedInputFile, FSInputFile, Message
+
+from data import config
+from loader import browser_pool, pdf_cache, render_client
+from utils.metrics import RENDER_DURATION
+from utils.pdf_render import render_pdf
+from utils.timings import timed
+
+
+async def render(guid=None, ids=None):
+    # Out-of-process workers when RENDER_WORKER_URLS is set, otherwise the local browser pool
+    mode = "local" if render_client is None else "worker"
+    status = "error"
+    started = time.perf_counter()
+    try:
+        with timed("render"):
+            if render_client is not None:
+                pdf = await render_client.render(guid=guid, ids=ids)
+            else:
+                pdf = await render_pdf(browser_pool, guid=guid, ids=ids)
+        status = "ok" if pdf else "empty"
+        return pdf
+    finally:
+        RENDER_DURATION.observe(time.perf_counter() - started, mode=mode, status=status)
+
+
+async def generate_pdf(guid):
+    return await render(guid=guid)
+
+
+async def generate_pdf_service(id):
+    return await render(ids=id)
+
+
+def _write_file(path, data):
+    with open(path, "wb") as file:
+        file.write(data)
+
 
-env = Env()
-env.read_env()
+@asynccontextmanager
+async def pdf_input_file(pdf: bytes, filename: str):
+    """
+    Upload for a rendered PDF. It is sent straight from memory unless it is
+    larger than PDF_SPILL_THRESHOLD, in which case it goes through a unique
+    temporary file in PDF_SPILL_DIR that is always removed afterwards.
+    """
+    if not config.PDF_SPILL_THRESHOLD or len(pdf) <= config.PDF_SPILL_THRESHOLD:
+        yield BufferedInputFile(pdf, filename=filename)
+        return
 
-FRONT_END_URL = env.str("FRONT_END_URL")
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=config.PDF_SPILL_DIR)
+    os.close(fd)
+    try:
+        await asyncio.to_thread(_write_file, path, pdf)
+        yield FSInputFile(path, filename=filename)
+    finally:
+        os.remove(path)
 
-async def generate_pdf(guid, pdf_path):
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True, args=['--no-sandbox'])
-        page = await browser.new_page()
-        await page.goto(f"{FRONT_END_URL}/results/{guid}", wait_until="networkidle")
-        time.sleep(4)
-        file = await page.pdf(path=pdf_path, format='A4', print_background=False)
-        await browser.close()
-        print(f"PDF saved at {pdf_path}")
-        return file
 
+async def send_result_pdf(message: Message, key: str, render, filename: str):
+    """
+    Send a result PDF, reusing the Telegram file_id or the PDF stored in
+    ``pdf_cache`` under ``key``; ``render()`` is awaited only on a miss.
+    """
+    file_id = await pdf_cache.get_file_id(key)
+    if file_id:
+        try:
+            return await message.answer_document(document=file_id)
+        except TelegramBadRequest as err:
+            logging.warning(f"Cached file_id for {key} was rejected: {err}")
 
+    pdf = await pdf_cache.get_pdf(key)
+    if pdf is None:
+        pdf = await render()
+        await pdf_cache.put_pdf(key, pdf)
 
+    async with pdf_input_file(pdf, filename) as document:
+        sent = await message.answer_document(document=document)
 
-async def generate_pdf_service(id, pdf_path):
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True, args=['--no-sandbox'])
-        page = await browser.new_page()
-        await page.goto(f"{FRONT_END_URL}/results?id={id}", wait_until="networkidle")
-        time.sleep(4)
-        file = await page.pdf(path=pdf_path, format='A4', print_background=False)
-        await browser.close()
-        print(f"PDF saved at {pdf_path}")
-        return file
+    await pdf_cache.set_file_id(key, sent.document.file_id)
+    return sent
@@ -2,17 +2,17 @@
 # PYPPETEER_CHROMIUM_REVISION = '1181217'
 # os.environ['PYPPETEER_CHROMIUM_REVISION'] = PYPPETEER_CHROMIUM_REVISION
 
-from environs import Env
 from pyppeteer import launch
+from pyppeteer.errors import TimeoutError as PyppeteerTimeoutError
 import ssl
 import asyncio
-import time
+import logging
 
+from data import config
+from utils.pdf_render import READY_CHECK
 
-env = Env()
-env.read_env()
 
-FRONT_END_URL = env.str("FRONT_END_URL")
+logger = logging.getLogger(__name__)
 
 
 async def generate_pdf(guid, pdf_path):
@@ -22,12 +22,15 @@ async def generate_pdf(guid, pdf_path):
 
     browser = await launch(headless=True, args=['--no-sandbox'])
     page = await browser.newPage()
-    response = await page.goto(f"{FRONT_END_URL}/results/{guid}",
+    response = await page.goto(f"{config.FRONT_END_URL}/results/{guid}",
                                {'waitUntil': 'networkidle2', 'timeout': 60000})
-    time.sleep(4)
-    print("FILE STATUS", response.status)
+    try:
+        await page.waitForFunction(READY_CHECK, {'timeout': config.PDF_READY_TIMEOUT * 1000})
+    except PyppeteerTimeoutError:
+        pass
+    logger.debug(f"Results page status {response.status}")
     if response.status in [200, '200']:
         await page.pdf({'path': pdf_path, 'format': 'A4'})
     
     await browser.close()
-    print('CLOSED')
\ No newline at end of file
+    logger.debug("Browser closed")
\ No newline at end of file
@@ -1,9 +1,12 @@
 from itertools import count
 from operator import add
 import random
-import os
-import ssl
 import asyncio
+import logging
+import hashlib
+import json
+import time
+from dataclasses import replace
 from typing import List, Set
 import aiohttp
 from aiogram import Router, F
@@ -12,23 +15,32 @@ from aiogram.types import (
     CallbackQuery,
     ReplyKeyboardMarkup,
     KeyboardButton,
-    FSInputFile,
     InlineKeyboardMarkup,
     InlineKeyboardButton,
     ContentType,
     ReplyKeyboardRemove,
 )
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject, CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from environs import Env
-from handlers.users.pdf import generate_pdf, generate_pdf_service
+from data import config
+from handlers.users.pdf import generate_pdf, generate_pdf_service, send_result_pdf
 from keyboards.default.main import (
+    get_main_keyboard,
     get_request_contact_keyboard,
     get_services_print_keyboard,
 )
+from keyboards.inline.callbacks import (
+    AdmittanceTypeCallback,
+    DoctorCallback,
+    HourCallback,
+    PageCallback,
+    PrintServiceCallback,
+    SlotCallback,
+)
 from keyboards.inline.main import (
     get_add_service_keyboard,
+    get_admission_calendar,
     get_cart_keyboard,
     get_come_back_keyboard,
     get_confirm_keyboard,
@@ -36,7 +48,23 @@ from keyboards.inline.main import (
     get_language_kb,
     get_today_keyboard,
 )
-from utils.helpers import get_full_name, get_safe_attribute, get_translation
+from loader import (
+    backend,
+    catalog_cache,
+    patient_cache,
+    render_queue,
+    slot_grid,
+    submission_cache,
+    timetable_cache,
+)
+from utils.backend import OK_STATUSES
+from utils.db_api.storage import try_lock
+from utils.helpers import get_full_name, get_labels, get_safe_attribute, get_translation, normalize_phone
+from utils.misc import rate_limit
+from utils.pdf_cache import PdfCache
+from utils.render_queue import QueueFullError, RenderInProgressError
+from utils.slots import daterange
+from utils.views import admittance_type_view, doctor_view, service_view
 from datetime import date, datetime, timedelta
 import re
 from aiogram_calendar import SimpleCalendar, SimpleCalendarCallback
@@ -44,17 +72,15 @@ from typing import List, Set, Dict
 
 
 
+logger = logging.getLogger(__name__)
+
 router = Router()
-env = Env()
-env.read_env()
-BACK_END_URL = env.str("BACK_END_URL")
 
+# FSM storage destiny of the per-user admittance submission lock
+ADMITTANCE_LOCK = "admittance_lock"
 
-def get_ssl():
-    ssl_context = ssl.create_default_context()
-    ssl_context.check_hostname = False
-    ssl_context.verify_mode = ssl.CERT_NONE
-    return ssl_context
+# What is kept per phone number in patient_cache; surname and birthday are shown on confirm
+PATIENT_FIELDS = ("id", "guid", "first_name", "last_name", "surname", "birthday")
 
 
 # FSM States
@@ -80,38 +106,6 @@ class UserState(StatesGroup):
     # admittance_add = State({})
 
 
-async def get_main_keyboard(state: FSMContext) -> InlineKeyboardMarkup:
-    data = await state.get_data()
-    lang = data.get("language", "ru")
-
-    services = get_translation(lang, "services")
-    add_service = get_translation(lang, "add_service")
-    change_lang = get_translation(lang, "change_lang")
-
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [
-                KeyboardButton(
-                    text=f"{services}",
-                    # callback_data="services"
-                ),
-                KeyboardButton(
-                    text=f"{add_service}",
-                    # callback_data="add_service"
-                ),
-            ],
-            [
-                KeyboardButton(
-                    text=f"{change_lang}",
-                    # callback_data="change_lang"
-                )
-            ],
-        ],
-        resize_keyboard=True,
-        # one_time_keyboard=True,
-    )
-
-
 # async def handle_start(message, callback, state):
 
 
@@ -138,7 +132,7 @@ async def handle_patient(message, state):
         await handle_language_request(message, state)
 
     elif patient_id:
-        main_kb = await get_main_keyboard(state)
+        main_kb = get_main_keyboard(lang)
         await message.answer(
             f"{get_translation(lang, 'select_action')}", reply_markup=main_kb
         )
@@ -146,13 +140,33 @@ async def handle_patient(message, state):
     else:
         
         await state.update_data(step='phone')
-        request_contact_keyboard = await get_request_contact_keyboard(state)
+        request_contact_keyboard = get_request_contact_keyboard(lang)
         await message.answer(
             f"{get_translation(lang, 'request_number')}",
             reply_markup=request_contact_keyboard,
         )
 
 
+def patient_summary(patient):
+    return {field: patient.get(field) for field in PATIENT_FIELDS}
+
+
+async def find_patient(phone_number):
+    """
+    Patient with this phone number, or ``None``. Found patients are cached,
+    but only for full phone numbers: other text is a free search.
+    """
+
+    async def lookup():
+        status, data = await backend.get(f"/api/patient/?q={phone_number}")
+        return patient_summary(data[0]) if status == 200 and data else None
+
+    phone_key = normalize_phone(phone_number)
+    if phone_key is None:
+        return await lookup()
+    return await patient_cache.get_or_load(phone_key, lookup)
+
+
 async def handle_contact(message: Message, state: FSMContext, fromMessage = False):
     contact = message.contact
     
@@ -169,7 +183,7 @@ async def handle_contact(message: Message, state: FSMContext, fromMessage = Fals
 
     lang = state_data.get("language", "ru")
 
-    confirm_kb = await get_confirm_keyboard(state)
+    confirm_kb = get_confirm_keyboard(lang)
 
     await message.answer(
         f"{get_translation(lang, 'number_received')} {phone_number}",
@@ -177,28 +191,16 @@ async def handle_contact(message: Message, state: FSMContext, fromMessage = Fals
     )
     loading_msg = await message.answer(get_translation(lang, "patient_finding"))
 
-    patient = None
-
-    ssl_context = get_ssl()
-    timeout = aiohttp.ClientTimeout(total=10)
-
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        try:
-            async with session.get(
-                f"{BACK_END_URL}/api/patient/?q={phone_number}", ssl=ssl_context
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data:
-                        patient = data[0]
-        except aiohttp.ClientError:
-            await message.answer(get_translation(lang, 'try_again'))
-            return
-        except asyncio.TimeoutError:
-            await message.answer(get_translation(lang, 'request_timeout'))
-            return
-        finally:
-            await loading_msg.delete()
+    try:
+        patient = await find_patient(phone_number)
+    except aiohttp.ClientError:
+        await message.answer(get_translation(lang, 'try_again'))
+        return
+    except asyncio.TimeoutError:
+        await message.answer(get_translation(lang, 'request_timeout'))
+        return
+    finally:
+        await loading_msg.delete()
 
     if patient:
         await state.update_data(
@@ -234,7 +236,7 @@ async def build_services_keyboard(data, selected_services=[], lang="ru"):
     for index, item in enumerate(data):
         button = InlineKeyboardButton(
             text=f"{index + 1}",
-            callback_data=f"print_service_{item['id']}"
+            callback_data=PrintServiceCallback(id=item["id"]).pack()
         )
         buttons.append(button)
 
@@ -300,27 +302,21 @@ async def handle_fetch_services(message: Message, state: FSMContext, from_state=
     else:
         
         loading_msg = await message.answer(get_translation(lang, "loading"))
-        ssl_context = get_ssl()
-        timeout = aiohttp.ClientTimeout(total=10)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            try:
-                async with session.get(
-                    f"{BACK_END_URL}/api/admittance-service/?patient={patient_id}&ordering=-registrationDate&isConfirmed=true",
-                    ssl=ssl_context,
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if data:
-                            services = data
-                            await state.update_data(fetched_services=data)
-            except aiohttp.ClientError:
-                await message.answer(get_translation(lang, 'try_again'))
-                return
-            except asyncio.TimeoutError:
-                await message.answer(get_translation(lang, 'request_timeout'))
-                return
-            finally:
-                await loading_msg.delete()
+        try:
+            status, data = await backend.get(
+                f"/api/admittance-service/?patient={patient_id}&ordering=-registrationDate&isConfirmed=true"
+            )
+            if status == 200 and data:
+                services = [service_view(item) for item in data]
+                await state.update_data(fetched_services=services)
+        except aiohttp.ClientError:
+            await message.answer(get_translation(lang, 'try_again'))
+            return
+        except asyncio.TimeoutError:
+            await message.answer(get_translation(lang, 'request_timeout'))
+            return
+        finally:
+            await loading_msg.delete()
 
     if services:
         # await state.update_data(patient_id=services['id'], patient_guid=services['guid'], patient_first_name=services['first_name'], patient_last_name=services['last_name'])
@@ -339,7 +335,7 @@ async def handle_fetch_services(message: Message, state: FSMContext, from_state=
         # await msg.delete()
     else:
 
-        come_back_kb = await get_come_back_keyboard(state)
+        come_back_kb = get_come_back_keyboard(lang)
         await message.answer(
             f"{get_translation(lang, 'empty_services')}",
             reply_markup=come_back_kb,
@@ -357,8 +353,8 @@ async def build_doctors_keyboard(data, state: FSMContext, lang="ru"):
     limit = state_data.get("limit", 10)
     
     paginate_kb = [
-        InlineKeyboardButton(text="<", callback_data="doctor_prev"),
-        InlineKeyboardButton(text=">", callback_data="doctor_next"),
+        InlineKeyboardButton(text="<", callback_data=PageCallback(target="doctor", step=-1).pack()),
+        InlineKeyboardButton(text=">", callback_data=PageCallback(target="doctor", step=1).pack()),
     ]
     
     
@@ -368,11 +364,11 @@ async def build_doctors_keyboard(data, state: FSMContext, lang="ru"):
         ]
     elif offset == 0:
         paginate_kb = [
-            InlineKeyboardButton(text=">", callback_data="doctor_next"),
+            InlineKeyboardButton(text=">", callback_data=PageCallback(target="doctor", step=1).pack()),
         ]
     elif offset + limit >= count:
         paginate_kb = [
-            InlineKeyboardButton(text="<", callback_data="doctor_prev"),
+            InlineKeyboardButton(text="<", callback_data=PageCallback(target="doctor", step=-1).pack()),
         ]
     
     
@@ -384,7 +380,7 @@ async def build_doctors_keyboard(data, state: FSMContext, lang="ru"):
     for index, item in enumerate(data):
         button = InlineKeyboardButton(
             text=f"{index + 1}",
-            callback_data=f"admittance_doctor_{item['id']}"
+            callback_data=DoctorCallback(id=item["id"]).pack()
         )
         buttons.append(button)
 
@@ -428,8 +424,8 @@ async def build_admittanceType_keyboard(data, state: FSMContext, lang="ru"):
     limit = state_data.get("limit", 10)
     
     paginate_kb = [
-        InlineKeyboardButton(text="<", callback_data="admittanceType_prev"),
-        InlineKeyboardButton(text=">", callback_data="admittanceType_next"),
+        InlineKeyboardButton(text="<", callback_data=PageCallback(target="admittanceType", step=-1).pack()),
+        InlineKeyboardButton(text=">", callback_data=PageCallback(target="admittanceType", step=1).pack()),
     ]
     
     
@@ -439,11 +435,11 @@ async def build_admittanceType_keyboard(data, state: FSMContext, lang="ru"):
         ]
     elif offset == 0:
         paginate_kb = [
-            InlineKeyboardButton(text=">", callback_data="admittanceType_next"),
+            InlineKeyboardButton(text=">", callback_data=PageCallback(target="admittanceType", step=1).pack()),
         ]
     elif offset + limit >= count:
         paginate_kb = [
-            InlineKeyboardButton(text="<", callback_data="admittanceType_prev"),
+            InlineKeyboardButton(text="<", callback_data=PageCallback(target="admittanceType", step=-1).pack()),
         ]
     
     
@@ -455,7 +451,7 @@ async def build_admittanceType_keyboard(data, state: FSMContext, lang="ru"):
     for index, item in enumerate(data):
         button = InlineKeyboardButton(
             text=f"{index + 1}",
-            callback_data=f"admittance_admittanceType_{item['id']}"
+            callback_data=AdmittanceTypeCallback(id=item["id"]).pack()
         )
         buttons.append(button)
 
@@ -502,34 +498,33 @@ async def handle_fetch_doctors(message: Message, state: FSMContext):
     offset = state_data.get("offset", 0)
 
     doctors = []
+    count = state_data.get("count", 0)
 
     
     loading_msg = await message.answer(get_translation(lang, "loading"))
-    ssl_context = get_ssl()
-    timeout = aiohttp.ClientTimeout(total=10)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        try:
-            async with session.get(
-                f"{BACK_END_URL}/api/staff/?role=2&p=true&limit={limit}&offset={offset}",
-                ssl=ssl_context,
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data['results']:
-                        doctors = data['results']
-                        await state.update_data(fetched_doctors=data['results'], count=data['count'])
-        except aiohttp.ClientError:
-            await message.answer(get_translation(lang, 'try_again'))
-            return
-        except asyncio.TimeoutError:
-            await message.answer(get_translation(lang, 'request_timeout'))
-            return
-        finally:
-            await loading_msg.delete()
+    async def fetch_page():
+        status, data = await backend.get(
+            f"/api/staff/?role=2&p=true&limit={limit}&offset={offset}"
+        )
+        return data if status == 200 else None
 
-    
-    
-    await state.update_data(fetched_doctors=doctors)
+    try:
+        data = await catalog_cache.get_or_load(("staff", limit, offset, None), fetch_page)
+        if data and data['results']:
+            doctors = [doctor_view(doctor) for doctor in data['results']]
+            count = data['count']
+    except aiohttp.ClientError:
+        await message.answer(get_translation(lang, 'try_again'))
+        return
+    except asyncio.TimeoutError:
+        await message.answer(get_translation(lang, 'request_timeout'))
+        return
+    finally:
+        await loading_msg.delete()
+
+    
+    
+    await state.update_data(fetched_doctors=doctors, count=count)
     if doctors:
         # await state.update_data(patient_id=services['id'], patient_guid=services['guid'], patient_first_name=services['first_name'], patient_last_name=services['last_name'])
 
@@ -547,7 +542,7 @@ async def handle_fetch_doctors(message: Message, state: FSMContext):
         # await msg.delete()
     else:
 
-        come_back_kb = await get_come_back_keyboard(state, 'come_back_add_service')
+        come_back_kb = get_come_back_keyboard(lang, 'come_back_add_service')
         await message.answer(
             f"{get_translation(lang, 'empty_list')}",
             reply_markup=come_back_kb,
@@ -567,34 +562,33 @@ async def handle_fetch_admittanceType(message: Message, state: FSMContext):
     offset = state_data.get("offset", 0)
 
     admittanceTypes = []
+    count = state_data.get("count", 0)
 
     
     loading_msg = await message.answer(get_translation(lang, "loading"))
-    ssl_context = get_ssl()
-    timeout = aiohttp.ClientTimeout(total=10)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        try:
-            async with session.get(
-                f"{BACK_END_URL}/api/admittance-type/?p=true&limit={limit}&offset={offset}&user={doctor}&showBot=true",
-                ssl=ssl_context,
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data['results']:
-                        admittanceTypes = data['results']
-                        await state.update_data(fetched_admittanceType=data['results'], count=data['count'])
-        except aiohttp.ClientError:
-            await message.answer(get_translation(lang, 'try_again'))
-            return
-        except asyncio.TimeoutError:
-            await message.answer(get_translation(lang, 'request_timeout'))
-            return
-        finally:
-            await loading_msg.delete()
+    async def fetch_page():
+        status, data = await backend.get(
+            f"/api/admittance-type/?p=true&limit={limit}&offset={offset}&user={doctor}&showBot=true"
+        )
+        return data if status == 200 else None
 
-    
-    
-    await state.update_data(fetched_admittanceType=admittanceTypes)
+    try:
+        data = await catalog_cache.get_or_load(("admittance-type", limit, offset, doctor), fetch_page)
+        if data and data['results']:
+            admittanceTypes = [admittance_type_view(item) for item in data['results']]
+            count = data['count']
+    except aiohttp.ClientError:
+        await message.answer(get_translation(lang, 'try_again'))
+        return
+    except asyncio.TimeoutError:
+        await message.answer(get_translation(lang, 'request_timeout'))
+        return
+    finally:
+        await loading_msg.delete()
+
+    
+    
+    await state.update_data(fetched_admittanceType=admittanceTypes, count=count)
     if admittanceTypes:
         # await state.update_data(patient_id=services['id'], patient_guid=services['guid'], patient_first_name=services['first_name'], patient_last_name=services['last_name'])
 
@@ -612,7 +606,7 @@ async def handle_fetch_admittanceType(message: Message, state: FSMContext):
         # await msg.delete()
     else:
 
-        come_back_kb = await get_come_back_keyboard(state, 'come_back_add_service')
+        come_back_kb = get_come_back_keyboard(lang, 'come_back_add_service')
         await message.answer(
             f"{get_translation(lang, 'empty_list')}",
             reply_markup=come_back_kb,
@@ -620,83 +614,107 @@ async def handle_fetch_admittanceType(message: Message, state: FSMContext):
         
 
 
-def _slot_label(dt: datetime) -> str:
-    return f"{dt.hour:02d}:{'00' if dt.minute < 30 else '30'}"
-
-def _overlapping_slots(start: datetime, end: datetime) -> Set[str]:
-    # start at the floor to :00 or :30
-    minute = 0 if start.minute < 30 else 30
-    slot = start.replace(minute=minute, second=0, microsecond=0)
-    if slot > start:
-        slot -= timedelta(minutes=30)
-
-    out = set()
-    while slot < end:
-        slot_end = slot + timedelta(minutes=30)
-        # any intersection with [start, end)
-        if slot_end > start and slot < end:
-            out.add(f"{slot.hour:02d}:{'00' if slot.minute == 0 else '30'}")
-        slot += timedelta(minutes=30)
-    return out
-
-def get_blocked_half_hour_slots(reserves: List[Dict], services: List[Dict]) -> Set[str]:
-    blocked: Set[str] = set()
-
-    # 1) block service registration half-hour slots
-    for s in services:
-        d = s.get("registrationDate")
-        if d:
-            try:
-                dt = datetime.fromisoformat(d)
-                blocked.add(_slot_label(dt))
-            except Exception:
-                pass
-
-    # 2) block every half-hour that overlaps reserve periods
-    for r in reserves:
-        start, end = r.get("start"), r.get("end")
-        if start and end:
-            try:
-                dt_start = datetime.fromisoformat(start)
-                dt_end = datetime.fromisoformat(end)
-                if dt_end > dt_start:
-                    blocked |= _overlapping_slots(dt_start, dt_end)
-            except Exception:
-                pass
-
-    return blocked
-
-
-
-
-def build_hour_buttons(start_hour: int, end_hour: int, blocked_times: Set[str]) -> InlineKeyboardMarkup:
+def build_hour_buttons(free_mask: int) -> InlineKeyboardMarkup:
     """
-    Builds an InlineKeyboardMarkup with times in HH:00 and HH:30 format,
-    skipping buttons that are blocked.
+    Builds an InlineKeyboardMarkup with the free slots of ``free_mask``,
+    one row per hour.
     """
-    if not (0 <= start_hour <= 23 and 0 <= end_hour <= 23 and start_hour <= end_hour):
-        raise ValueError("start_hour and end_hour must be in range 0–23 and start <= end")
-
-    inline_keyboard = []
-
-    for hour in range(start_hour, end_hour + 1):
-        row = []
-
-        for minute in ["00", "30"]:
-            time_str = f"{hour:02d}:{minute}"
-            if time_str in blocked_times:
-                continue  # 🔒 time is booked, skip
-            row.append(
-                InlineKeyboardButton(
-                    text=time_str,
-                    callback_data=f"select_hour:{time_str}"
-                )
+    rows = {}
+
+    for slot in slot_grid.free_times(free_mask):
+        rows.setdefault(slot.hour, []).append(
+            InlineKeyboardButton(
+                text=slot.strftime("%H:%M"),
+                callback_data=HourCallback(hour=slot.hour, minute=slot.minute).pack()
             )
+        )
+
+    return InlineKeyboardMarkup(inline_keyboard=list(rows.values()))
+
+
+async def fetch_free_mask(doctor, day: date):
+    """
+    Free slots of ``doctor`` on ``day`` as a ``slot_grid`` bitmap, from
+    ``timetable_cache`` or the backend. ``None`` if the backend refused.
+    """
+    async def load():
+        status, data = await backend.get(
+            f"/api/doctor-timetable/?doctor={doctor}&date={day:%Y-%m-%d}&isConfirmed=true"
+        )
+        if status != 200:
+            return None
+        timetable = data[0] if data else {}
+        return slot_grid.free_mask(timetable.get("reserves", []), timetable.get("services", []), day)
+
+    return await timetable_cache.get_or_load((str(doctor), day.isoformat()), load)
+
+
+async def find_free_slots(doctors, days, count):
+    """
+    The ``count`` earliest free (doctor, start) over ``doctors`` x ``days``,
+    fetched concurrently. Days that fail are skipped unless all of them do.
+    """
+    pairs = [(doctor, day) for doctor in doctors for day in days]
+    masks = await asyncio.gather(*(fetch_free_mask(doctor, day) for doctor, day in pairs), return_exceptions=True)
+
+    errors = [mask for mask in masks if isinstance(mask, BaseException)]
+    if errors and len(errors) == len(masks):
+        raise errors[0]
+
+    free = {pair: mask for pair, mask in zip(pairs, masks) if isinstance(mask, int)}
+    return slot_grid.earliest_free(free, count, not_before=datetime.now())
 
-        if row:
-            inline_keyboard.append(row)
 
-    return InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
+def build_free_slot_buttons(slots) -> InlineKeyboardMarkup:
+    buttons = [
+        InlineKeyboardButton(
+            text=start.strftime("%d.%m %H:%M"),
+            callback_data=SlotCallback(day=start.strftime("%Y%m%d"), hour=start.hour, minute=start.minute).pack(),
+        )
+        for _, start in slots
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=[buttons[i:i + 2] for i in range(0, len(buttons), 2)])
+
+
+async def handle_next_free_slots(message: Message, state: FSMContext):
+    data = await state.get_data()
+    lang = data.get("language", "ru")
+    doctor = data.get("service", {}).get("doctor")
+
+    if doctor is None:
+        await handle_fetch_doctors(message, state)
+        return
+
+    # Sundays are closed, as in the calendar
+    days = [day for day in daterange(date.today(), config.NEXT_FREE_DAYS) if day.weekday() != 6]
+
+    loading_msg = await message.answer(get_translation(lang, "loading"))
+    try:
+        slots = await find_free_slots([doctor], days, config.NEXT_FREE_COUNT)
+    except aiohttp.ClientError:
+        await message.answer(get_translation(lang, 'try_again'))
+        return
+    except asyncio.TimeoutError:
+        await message.answer(get_translation(lang, 'request_timeout'))
+        return
+    finally:
+        await loading_msg.delete()
+
+    if not slots:
+        await message.answer(
+            get_translation(lang, "no_free_slots"), reply_markup=await get_admission_calendar(lang)
+        )
+        return
+
+    await message.answer(get_translation(lang, "nearest_free_slots"), reply_markup=build_free_slot_buttons(slots))
+
+
+def invalidate_timetables(cart):
+    """Forget the cached days just booked, so the next view shows the new reservations."""
+    for item in cart:
+        day = item.get("registration_date") or (item.get("registrationDate") or "")[:10]
+        if item.get("doctor") is not None and day:
+            timetable_cache.invalidate((str(item["doctor"]), day))
 
 
 async def handle_fetch_doctor_services(message: Message, state: FSMContext, msg = ""):
@@ -708,41 +726,27 @@ async def handle_fetch_doctor_services(message: Message, state: FSMContext, msg
     
     doctor = state_data.get("service", {})["doctor"]
     registration_date = state_data.get("service", {}).get("registration_date")
+    day = datetime.strptime(registration_date, "%Y-%m-%d").date()
 
-    services = []
-    recerves = []
-    
     loading_msg = await message.answer(get_translation(lang, "loading"))
-    ssl_context = get_ssl()
-    timeout = aiohttp.ClientTimeout(total=10)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        try:
-            async with session.get(
-                f"{BACK_END_URL}/api/doctor-timetable/?doctor={doctor}&date={registration_date}&isConfirmed=true",
-                ssl=ssl_context,
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data:
-                        services = data[0].get("services", [])
-                        reserves = data[0].get("reserves", [])
-                        
-                        
-        except aiohttp.ClientError:
-            await message.answer(get_translation(lang, 'try_again'))
-            return
-        except asyncio.TimeoutError:
-            await message.answer(get_translation(lang, 'request_timeout'))
-            return
-        finally:
-            await loading_msg.delete()
+    try:
+        free_mask = await fetch_free_mask(doctor, day)
+    except aiohttp.ClientError:
+        await message.answer(get_translation(lang, 'try_again'))
+        return
+    except asyncio.TimeoutError:
+        await message.answer(get_translation(lang, 'request_timeout'))
+        return
+    finally:
+        await loading_msg.delete()
             
     
     
-    booked_times = get_blocked_half_hour_slots(reserves, services)
-    
-    
-    buttons = build_hour_buttons(8, 17, booked_times)
+    if free_mask is None:
+        # As before: without a timetable every slot is offered
+        free_mask = slot_grid.full
+
+    buttons = build_hour_buttons(free_mask)
     
     await message.answer(msg, reply_markup=buttons)
 
@@ -776,7 +780,7 @@ async def process_confirmation(callback: CallbackQuery, state: FSMContext):
     
 
     if callback.data == "confirm_yes":
-        main_kb = await get_main_keyboard(state)
+        main_kb = get_main_keyboard(lang)
         await callback.message.answer(
             f"✅ {get_translation(lang, 'confirmed')}: {phone}", reply_markup=main_kb
         )
@@ -791,6 +795,11 @@ async def process_confirmation(callback: CallbackQuery, state: FSMContext):
 
         # await callback.message.edit_reply_markup()
         await callback.answer()
+
+        # Registering someone else on this number: forget the cached patient
+        phone_key = normalize_phone(phone)
+        if phone_key is not None:
+            patient_cache.invalidate(phone_key)
         
         await state.update_data(
             add_patient=True,
@@ -869,7 +878,7 @@ async def handle_open_cart(callback: CallbackQuery, state: FSMContext, additiona
     
     await callback.message.answer(
         message,
-        reply_markup=await get_cart_keyboard(state)
+        reply_markup=get_cart_keyboard(lang, bool(cart_services))
     )
     
     
@@ -879,787 +888,401 @@ async def handle_open_cart(callback: CallbackQuery, state: FSMContext, additiona
  
         
 async def handle_post_patient(message: Message, state: FSMContext):
-    
-    ssl_context = get_ssl()
-
-    timeout = aiohttp.ClientTimeout(total=10)
 
     guid = None
     patient_name = None
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        state_data = await state.get_data()
-        lang = state_data.get('language', 'ru')
+    state_data = await state.get_data()
+    lang = state_data.get('language', 'ru')
+    
+    loading_msg = await message.answer(
+        f"{get_translation(lang, 'loading')}",
+    )
+    try:
         
-        loading_msg = await message.answer(
-            f"{get_translation(lang, 'loading')}",
-        )
-        try:
-            
-            patient_data = state_data.get("patient_form", {})
-            url = f"{BACK_END_URL}/api/patient/"
-            
+        patient_data = state_data.get("patient_form", {})
+        
+        
+        status, data = await backend.post("/api/patient/", data=patient_data)
+        if status in [200, 201, 204] and data:
             
-            async with session.post(url, ssl=ssl_context, data=patient_data) as response:
-                if response.status in [200, 201, 204]:
-                    data = await response.json()
-                    if data:
-                        
-                        # print(data)
-
-                        guid = data["guid"]
-                        patient_name = f"{data['first_name']} {data['last_name']}"
-                        await state.update_data(
-                            patient_id=data["id"],
-                            patient_guid=guid,
-                            patient_first_name=data["first_name"],
-                            patient_last_name=data["last_name"],
-                            add_patient=False,
-                            step="",
-                        )
-                        await message.answer(
-                            f"{get_translation(lang, 'confirmed')}: {patient_name}",
-                            reply_markup=await get_main_keyboard(state),
-                        )
-                        
-                        patient_form = state_data.get("patient_form", {})
-                        phone = state_data.get("phone", "")
-                        patient_form["phone"] = phone
-                        
-                        main_kb = await get_main_keyboard(state)
-                        await message.answer(
-                            f"✅ {get_translation(lang, 'confirmed')}: {phone}", reply_markup=main_kb
-                        )
-        except aiohttp.ClientError:
-            print("aiohttp.ClientError")
-            await message.answer(get_translation(lang, 'try_again'))
-            await state.update_data(
-                add_patient=True,
-                step=""
-            )
-            await message.answer(
-                f"{get_translation(lang, 'write_name_for_registration')}\n{get_translation(lang, 'name_example')}",
-                # reply_markup=confirm_kb,
-            )
+            # print(data)
 
-            return
-        except asyncio.TimeoutError:
-            print("asyncio.TimeoutError")
-            await message.answer(get_translation(lang, 'request_timeout'))
+            guid = data["guid"]
+            patient_name = f"{data['first_name']} {data['last_name']}"
+
+            # Drop whatever was cached for this number before registration
+            phone_key = normalize_phone(patient_data.get("phone") or state_data.get("phone_number"))
+            if phone_key is not None:
+                patient_cache.invalidate(phone_key)
+                patient_cache.set(phone_key, patient_summary(data))
             await state.update_data(
-                add_patient=True,
-                step=""
+                patient_id=data["id"],
+                patient_guid=guid,
+                patient_first_name=data["first_name"],
+                patient_last_name=data["last_name"],
+                add_patient=False,
+                step="",
             )
             await message.answer(
-                f"{get_translation(lang, 'write_name_for_registration')}\n{get_translation(lang, 'name_example')}",
-                # reply_markup=confirm_kb,
-            )
-            return
-        
-        except Exception as e:
-            print("Error", e)
-            await message.answer(get_translation(lang, 'try_again'))
-            await state.update_data(
-                add_patient=True,
-                step=""
+                f"{get_translation(lang, 'confirmed')}: {patient_name}",
+                reply_markup=get_main_keyboard(lang),
             )
             
+            patient_form = state_data.get("patient_form", {})
+            phone = state_data.get("phone", "")
+            patient_form["phone"] = phone
+            
+            main_kb = get_main_keyboard(lang)
             await message.answer(
-                f"{get_translation(lang, 'write_name_for_registration')}\n{get_translation(lang, 'name_example')}",
-                # reply_markup=confirm_kb,
+                f"✅ {get_translation(lang, 'confirmed')}: {phone}", reply_markup=main_kb
             )
-       
-            return
-        finally:
-            await loading_msg.delete()
-
-
-
+    except aiohttp.ClientError:
+        logger.warning("Patient registration failed", exc_info=True)
+        await message.answer(get_translation(lang, 'try_again'))
+        await state.update_data(
+            add_patient=True,
+            step=""
+        )
+        await message.answer(
+            f"{get_translation(lang, 'write_name_for_registration')}\n{get_translation(lang, 'name_example')}",
+            # reply_markup=confirm_kb,
+        )
 
-   
-async def handle_post_admittance(message: Message, state: FSMContext):
+        return
+    except asyncio.TimeoutError:
+        logger.warning("Patient registration timed out")
+        await message.answer(get_translation(lang, 'request_timeout'))
+        await state.update_data(
+            add_patient=True,
+            step=""
+        )
+        await message.answer(
+            f"{get_translation(lang, 'write_name_for_registration')}\n{get_translation(lang, 'name_example')}",
+            # reply_markup=confirm_kb,
+        )
+        return
     
-    ssl_context = get_ssl()
-
-    timeout = aiohttp.ClientTimeout(total=10)
-
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        state_data = await state.get_data()
-        
-        lang = state_data.get('language', 'ru')
-        
-        loading_msg = await message.answer(
-            f"{get_translation(lang, 'loading')}",
+    except Exception as e:
+        logger.exception("Patient registration failed")
+        await message.answer(get_translation(lang, 'try_again'))
+        await state.update_data(
+            add_patient=True,
+            step=""
         )
-        try:
-            
-            cart = state_data.get("cart", [])
-            
-            if not cart:
-                await handle_open_cart(message, state)
-                return
-            
-            
-            services = []
-            
-            
-            for item in cart:
-                service = {
-                    "doctor": get_safe_attribute(item, "doctor"),
-                    "admittanceType": get_safe_attribute(item, "admittanceType"),
-                    "registrationDate": get_safe_attribute(item, "registrationDate"),
-                    'quantity': 1,
-                    'patient': get_safe_attribute(state_data, "patient_id"),
-                    'amount' : float(get_safe_attribute(item, 'admittanceType_obj.amount', 0)),
-                    'totalAmount' : float(get_safe_attribute(item, 'admittanceType_obj.amount', 0) * 1),
-                    'paidAmount' : float(get_safe_attribute(item, 'admittanceType_obj.amount', 0) * 1),
-                    # 'paidAmount' : float(get_safe_attribute(item, 'admittanceType_obj.price', 0) * 1),
-                    'isCome': False,
-                    'preBooking': True
-                }
-                services.append(service)
-            
-            
-            admittance = {
-                "patient": state_data.get("patient_id"),
-                "registrationDate" : datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
-                "services": list(services),
-                'source': 2
-            }
-            
-            
-            # print(admittance)
-            
-            url = f"{BACK_END_URL}/api/admittance/"
-            
-            
-            async with session.post(url, ssl=ssl_context, json=admittance) as response:
-                
-                # print(await response.json())
-                if response.status in [200, 201, 204]:
-                    data = await response.json()
-                    if data:
-                        
-                        # print(data)
-                        
-                        await state.update_data(
-                            cart=[],
-                            service={}
-                        )
-                        
-                        await message.answer(
-                            f"{get_translation(lang, 'service_saved')}",
-                            reply_markup=await get_main_keyboard(state),
-                        )
-                        
-                    
-        except aiohttp.ClientError:
-            print("aiohttp.ClientError")
-            await message.answer(get_translation(lang, 'try_again'))
-            return
-        except asyncio.TimeoutError:
-            print("asyncio.TimeoutError")
-            await message.answer(get_translation(lang, 'request_timeout'))
-            return
-        except Exception as e:
-            print(f"Exception: {e}")
-            await message.answer(get_translation(lang, 'error_try'))
-            return
         
-        finally:
-            await loading_msg.delete()
+        await message.answer(
+            f"{get_translation(lang, 'write_name_for_registration')}\n{get_translation(lang, 'name_example')}",
+            # reply_markup=confirm_kb,
+        )
+   
+        return
+    finally:
+        await loading_msg.delete()
 
 
 
 
-async def handle_language(callback: CallbackQuery, state: FSMContext):
-    await state.update_data(language=callback.data)
-    await callback.answer()
-    await handle_patient(callback.message, state)
+   
+def admittance_key(admittance) -> str:
+    """
+    Same patient and same services within one ADMITTANCE_IDEMPOTENCY_TTL
+    window -> same key. A later rebooking of the same slot gets a new key.
+    """
+    services = sorted(
+        [str(service.get(field)) for field in ("doctor", "admittanceType", "registrationDate")]
+        for service in admittance["services"]
+    )
+    window = int(time.time() // config.ADMITTANCE_IDEMPOTENCY_TTL)
+    payload = json.dumps({"patient": admittance["patient"], "services": services, "window": window}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
 
 
-# Start command
-@router.message()
-async def start(message: Message, state: FSMContext):
-    # await state.set_data()
-    
-    
-    print(message.text)
+async def submit_admittance(admittance):
+    """
+    POST the admittance once per key: concurrent submits of the same cart
+    in this process, and repeats within a few seconds, share one backend
+    call and its result. The
+    key also goes to the backend as Idempotency-Key. The POST itself is not
+    retried, since the backend is not known to de-duplicate on that key.
+    Returns the created admittance, or ``None`` if the backend refused it.
+    """
+    key = admittance_key(admittance)
 
-    data = await state.get_data()
-    lang = data.get("language", "ru")
-    patient_id = data.get("patient_id", None)
-    patient_guid = data.get("patient_guid", None)
-    step = data.get("step", "")
+    async def post():
+        status, data = await backend.post(
+            "/api/admittance/", json=admittance, headers={"Idempotency-Key": key}
+        )
+        return data if status in OK_STATUSES and data else None
 
-    services = get_translation(lang, "services")
-    add_service = get_translation(lang, "add_service")
-    change_lang = get_translation(lang, "change_lang")
+    return await submission_cache.get_or_load(key, post)
 
 
-    add_patient = data.get("add_patient", False)
-    phone_number = data.get("phone_number", "")
+async def handle_post_admittance(message: Message, state: FSMContext):
+
+    state_data = await state.get_data()
     
+    lang = state_data.get('language', 'ru')
     
-    if add_patient and phone_number and step != "birthday":
+    loading_msg = await message.answer(
+        f"{get_translation(lang, 'loading')}",
+    )
+    try:
         
-        message_text = message.text.split(" ")
+        cart = state_data.get("cart", [])
         
-        service = data.get("patient_form", {})
-        if len(message_text) < 2:
-            await message.answer(
-                f"{get_translation(lang, 'write_name_for_registration')}\n{get_translation(lang, 'name_example')}",
-                reply_markup=ReplyKeyboardRemove(),
-            )
+        if not cart:
+            await handle_open_cart(message, state)
             return
-        first_name = message_text[0]
-        last_name = message_text[1]
         
         
-        if not service:
-            service = {"phone": phone_number}
-            
-        service["first_name"] = first_name
-        service["last_name"] = last_name
+        services = []
         
         
-        await state.update_data(patient_form=service)
-        gender_kb = await get_gender_keyboard(state)
-        await message.answer(
-            f"{get_translation(lang, 'select_gender')}",
-            reply_markup=gender_kb,
-        )
+        for item in cart:
+            service = {
+                "doctor": get_safe_attribute(item, "doctor"),
+                "admittanceType": get_safe_attribute(item, "admittanceType"),
+                "registrationDate": get_safe_attribute(item, "registrationDate"),
+                'quantity': 1,
+                'patient': get_safe_attribute(state_data, "patient_id"),
+                'amount' : float(get_safe_attribute(item, 'admittanceType_obj.amount', 0)),
+                'totalAmount' : float(get_safe_attribute(item, 'admittanceType_obj.amount', 0) * 1),
+                'paidAmount' : float(get_safe_attribute(item, 'admittanceType_obj.amount', 0) * 1),
+                # 'paidAmount' : float(get_safe_attribute(item, 'admittanceType_obj.price', 0) * 1),
+                'isCome': False,
+                'preBooking': True
+            }
+            services.append(service)
         
-    
-    elif message.text is not None and message.text.startswith('/start ') and len(message.text.split(" ")) == 2:
-        await handle_code(message, state, customCode=message.text.split(" ")[1])
-    
-    # elif message.text is not None and re.match(r"^\d+$", message.text):
-    #     await handle_code(message, state, message.text)
         
-    elif message.text == "/start":
+        admittance = {
+            "patient": state_data.get("patient_id"),
+            "registrationDate" : datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+            "services": list(services),
+            'source': 2
+        }
+        
+        
+        # print(admittance)
+        
+        # One submission per user at a time, across every bot process
+        lock = replace(state.key, destiny=ADMITTANCE_LOCK)
+        if not await try_lock(state.storage, lock, config.ADMITTANCE_LOCK_TTL):
+            await message.answer(get_translation(lang, 'admittance_in_progress'))
+            return
+        try:
+            data = await submit_admittance(admittance)
+        finally:
+            await state.storage.set_data(lock, {})
+        
+        if data:
+            
+            # print(data)
+            invalidate_timetables(cart)
+            
+            await state.update_data(
+                cart=[],
+                service={}
+            )
+            
+            await message.answer(
+                f"{get_translation(lang, 'service_saved')}",
+                reply_markup=get_main_keyboard(lang),
+            )
+                
+                    
+    except aiohttp.ClientError:
+        logger.warning("Admittance submission failed", exc_info=True)
+        await message.answer(get_translation(lang, 'try_again'))
+        return
+    except asyncio.TimeoutError:
+        logger.warning("Admittance submission timed out")
+        await message.answer(get_translation(lang, 'request_timeout'))
+        return
+    except Exception as e:
+        logger.exception("Admittance submission failed")
+        await message.answer(get_translation(lang, 'error_try'))
+        return
+    
+    finally:
+        await loading_msg.delete()
 
-        await message.answer(
-            f"{get_translation(lang, 'welcome')}",
-            reply_markup=ReplyKeyboardRemove(),
-        )
-        await handle_patient(message, state)
 
-    elif message.text == "/reset":
 
-        # ReplyKeyboardRemove()
 
-        await message.answer(
-            f"{get_translation(lang, 'reset')}",
-            reply_markup=ReplyKeyboardRemove(),
-        )
+async def select_registration_date(message: Message, state: FSMContext, data, selected: datetime):
+    lang = data.get("language", "ru")
+    service = data.get("service", {})
 
-        await state.clear()
-        # if lang is None:
-        await handle_language_request(message, state)
+    service['registration_date'] = selected.strftime("%Y-%m-%d")
+    await state.update_data(service=service, step="")
+    message_text = f"{get_translation(lang, 'select_admission_time')}"
+    await handle_fetch_doctor_services(message, state, message_text)
 
-    elif message.contact and step == 'phone':
-        await handle_contact(message, state)
-    elif message.text and step == 'phone':
-        await handle_contact(message, state, True)
 
-    elif message.text == services:
-       
-        services_print_kb = await get_services_print_keyboard(state)
-        await handle_fetch_services(message, state)
+async def handle_patient_name(message: Message, state: FSMContext, data):
+    lang = data.get("language", "ru")
+    message_text = (message.text or "").split()
 
-      
+    service = data.get("patient_form", {})
+    if len(message_text) < 2:
+        await message.answer(
+            f"{get_translation(lang, 'write_name_for_registration')}\n{get_translation(lang, 'name_example')}",
+            reply_markup=ReplyKeyboardRemove(),
+        )
+        return
+    first_name = message_text[0]
+    last_name = message_text[1]
 
-    elif message.text == add_service:
-        data = await state.get_data()
-        lang = data.get("language", "ru")
-        add_service_text = get_translation(lang, "add_serv")
-        add_service_kb = await get_add_service_keyboard(state)
-        await message.answer(add_service_text, reply_markup=add_service_kb)
 
-    elif message.text == change_lang:
-        await handle_language_request(message, state)
-    
-    
-    elif step == "birthday":
+    if not service:
+        service = {"phone": data.get("phone_number", "")}
 
-        # await callback.message.delete()
-        # await callback.answer()  # Optional: acknowledge the button press
+    service["first_name"] = first_name
+    service["last_name"] = last_name
 
-        state_data = await state.get_data()
-        lang = state_data.get("language", "ru")
-        service = state_data.get("patient_form", {})
-        
-        try:
-            day, month, year = message.text.split(".")
-            print(day, month, year)
-            if not (day.isdigit() and month.isdigit() and year.isdigit()):
-                await message.answer(f"{get_translation(lang, 'select_birthday')}")
-                return
-            selected_date = "-".join([year, month, day])
-            
-            
-            service['birthday'] = selected_date
-            await state.update_data(patient_form=service, step="check_data")
-            gender_text = 'male' if service.get('gender', '') == 1 else 'female'
-            message_text = f"<b>{get_translation(lang, "is_correct")}:</b>\n{get_translation(lang, "name")}: {service.get('first_name', '')} {service.get('last_name', '')}\n{get_translation(lang, 'phone')}: {service.get('phone', '')}\n{get_translation(lang, 'birthday')}: {selected_date}\n{get_translation(lang, 'gender')}: {get_translation(lang, gender_text)}"
-            await message.answer(message_text, reply_markup=await get_confirm_keyboard(state))
-            
-        
-        
-            # await callback.answer()
-        except Exception as e:
-           
-            await message.answer(f"{get_translation(lang, "select_birthday")}")
-        
-        
-    elif step == "registrationDate":
 
-        # await callback.message.delete()
-        # await callback.answer()  # Optional: acknowledge the button press
+    await state.update_data(patient_form=service)
+    gender_kb = get_gender_keyboard(lang)
+    await message.answer(
+        f"{get_translation(lang, 'select_gender')}",
+        reply_markup=gender_kb,
+    )
 
-        state_data = await state.get_data()
-        lang = state_data.get("language", "ru")
-        service = state_data.get("service", {})
-        
-        try:
-            day, month, year = message.text.split(".")
-            print(day, month, year)
-            if not (day.isdigit() and month.isdigit() and year.isdigit()):
-                today_kb = await get_today_keyboard(state)
-                await message.answer(f"{get_translation(lang, 'select_admission_date')}", reply_markup=today_kb)
-                return
-            
-            
-            selected_date = "-".join([year, month, day])
-            
-            
-            service['registration_date'] = selected_date
-            await state.update_data(service=service, step="")
-            message_text = f"{get_translation(lang, "select_admission_time")}"
-            # await message.answer(message_text, reply_markup=build_hour_buttons(7, 18))
-            await handle_fetch_doctor_services(message, state, message_text)
-            
-            
-        
-        
-            # await callback.answer()
-        except Exception as e:
-            print(e)
-            today_kb = await get_today_keyboard(state)
-            await message.answer(f"{get_translation(lang, "select_admission_date")}", reply_markup=today_kb)
-        
-        
-    
-    
-    
 
+async def handle_phone(message: Message, state: FSMContext, data):
+    if message.contact:
+        await handle_contact(message, state)
+    elif message.text:
+        await handle_contact(message, state, True)
 
-# # Start command
-@router.callback_query()
-async def handle_callback(callback: CallbackQuery, state: FSMContext):
-    data = await state.get_data()
-    add_patient = data.get("add_patient", False)
-    step = data.get("step")
-    
-    print("CALBACCCCCCCCCCCCCCCCKKKKKK", callback.data)
 
-    if callback.data in ["uz", "ru", "en"]:
-        await handle_language(callback, state)
+async def handle_birthday(message: Message, state: FSMContext, data):
+    lang = data.get("language", "ru")
+    service = data.get("patient_form", {})
 
-    elif callback.data in ["confirm_yes", "confirm_no"] and not add_patient and step != "service_confirm":
-        await callback.message.delete()
-        await callback.answer()  
-        await process_confirmation(callback, state)
-        
-    # elif callback.data and callback.data.startswith("simple_calendar:"):
-        # parsed_data = SimpleCalendarCallbackData.parse(callback.data)  # ✅ this is key
-        # selected, date = await SimpleCalendar().process_selection(callback, callback.data)
-        
-        
-        # print(selected, 'selected')
+    try:
+        day, month, year = message.text.split(".")
+        if not (day.isdigit() and month.isdigit() and year.isdigit()):
+            await message.answer(f"{get_translation(lang, 'select_birthday')}")
+            return
+        selected_date = "-".join([year, month, day])
 
-        # if selected:
-        #     # action=4, user selected a date
-        #     await callback.message.edit_text(f"✅ Вы выбрали дату: {date.strftime('%Y-%m-%d')}")
-        # else:
-        #     # action in [2, 3, 5, 6], just update calendar
-        #     await callback.answer()
 
-        # return
-    
-    elif callback.data in ["confirm_yes", "confirm_no"] and add_patient and step != "service_confirm":
-        await callback.message.delete()
-        await callback.answer()  
-        await process_patient_add_confirmation(callback, state)
-        
-    elif callback.data == "come_back_add_service":
-        await callback.message.delete()
-        await callback.answer()  
-        data = await state.get_data()
-        lang = data.get("language", "ru")
-        add_service_text = get_translation(lang, "add_serv")
-        add_service_kb = await get_add_service_keyboard(state)
-        await callback.message.answer(add_service_text, reply_markup=add_service_kb)
-    
-    
-    if callback.data.startswith("simple_calendar:"):
-        selected, date = await SimpleCalendar().process_selection(
-            callback,
-            SimpleCalendarCallback.unpack(callback.data)
-        )
-        
-        if 'CANCEL' in callback.data:
-            await callback.message.delete()
-            await callback.answer()
-            await handle_fetch_doctors(callback.message, state)
-        
-        elif "TODAY" in callback.data:
-            await callback.message.delete()
-            await callback.answer()  # Optional: acknowledge the button press
+        service['birthday'] = selected_date
+        await state.update_data(patient_form=service, step="check_data")
+        gender_text = 'male' if service.get('gender', '') == 1 else 'female'
+        message_text = f"<b>{get_translation(lang, 'is_correct')}:</b>\n{get_translation(lang, 'name')}: {service.get('first_name', '')} {service.get('last_name', '')}\n{get_translation(lang, 'phone')}: {service.get('phone', '')}\n{get_translation(lang, 'birthday')}: {selected_date}\n{get_translation(lang, 'gender')}: {get_translation(lang, gender_text)}"
+        await message.answer(message_text, reply_markup=get_confirm_keyboard(lang))
 
-            state_data = await state.get_data()
-            lang = state_data.get("language", "ru")
-            service = state_data.get("service", {})
-        
-            selected_date = datetime.now().strftime("%Y-%m-%d")
-                
-            service['registration_date'] = selected_date
-            await state.update_data(service=service, step="")
-            message_text = f"{get_translation(lang, "select_admission_time")}"
-            # await callback.message.answer(message_text, reply_markup=build_hour_buttons(7, 18))
-            await handle_fetch_doctor_services(callback.message, state, message_text)
-        
-        if selected:
-            # await callback.message.answer(f"You selected: {date.strftime('%Y-%m-%d')}")
-            await callback.message.delete()
-            await callback.answer()  # Optional: acknowledge the button press
-
-            state_data = await state.get_data()
-            lang = state_data.get("language", "ru")
-            service = state_data.get("service", {})
-            
-            if date.date() < datetime.now().date() or date.date().weekday() == 6:
-                calendar = SimpleCalendar()
-                await callback.message.answer(f"{get_translation(lang, 'uncorrect_date')}\n{get_translation(lang, 'select_admission_date')}", reply_markup=await calendar.start_calendar())
-                
-                return
-        
-            selected_date = date.strftime('%Y-%m-%d')
-                
-                
-            service['registration_date'] = selected_date
-            await state.update_data(service=service, step="")
-            message_text = f"{get_translation(lang, "select_admission_time")}"
-            # await callback.message.answer(message_text, reply_markup=build_hour_buttons(7, 18))
-            await handle_fetch_doctor_services(callback.message, state, message_text)
-            return
-    
-    elif step == "registrationDate" and callback.data == "today":
+    except Exception as e:
+        await message.answer(f"{get_translation(lang, 'select_birthday')}")
 
-        await callback.message.delete()
-        await callback.answer()  # Optional: acknowledge the button press
 
-        state_data = await state.get_data()
-        lang = state_data.get("language", "ru")
-        service = state_data.get("service", {})
-       
-        selected_date = datetime.now().strftime("%Y-%m-%d")
-        
-            
-            
-        service['registration_date'] = selected_date
-        await state.update_data(service=service, step="")
-        message_text = f"{get_translation(lang, "select_admission_time")}"
-        # await callback.message.answer(message_text, reply_markup=build_hour_buttons(7, 18))
-        await handle_fetch_doctor_services(callback.message, state, message_text)
-            
-    
-    
-    
-    elif step == "service_confirm":
-        await callback.message.delete()
-        await callback.answer()
-        
-        if callback.data == "confirm_yes":
-            data = await state.get_data()
-            cart = data.get("cart", [])
-            service = data.get("service", {})
-            cart.append(service)
-            
-            await state.update_data(service={}, step="", cart=cart)
-            lang = data.get("language", "ru")
-            # add_service_text = get_translation(lang, "add_serv")
-            # add_service_kb = await get_add_service_keyboard(state)
-            await callback.message.answer(f"{get_translation(lang, "added_to_cart")}")
-            await handle_open_cart(callback, state)
-        
-        elif callback.data == "confirm_no":
-            await state.update_data(service={}, step="")
-            data = await state.get_data()
-            lang = data.get("language", "ru")
-            await callback.message.answer(f"{get_translation(lang, "canceled")}")
-            await handle_open_cart(callback, state)
+async def handle_registration_date(message: Message, state: FSMContext, data):
+    lang = data.get("language", "ru")
+
+    try:
+        day, month, year = message.text.split(".")
+        if not (day.isdigit() and month.isdigit() and year.isdigit()):
+            today_kb = get_today_keyboard(lang)
+            await message.answer(f"{get_translation(lang, 'select_admission_date')}", reply_markup=today_kb)
             return
-        
-        
-        
-        # await process_patient_add_confirmation(callback, state)
-        
-        
-    elif callback.data == "change_lang":
-        await callback.message.delete()
-        await callback.answer()  
-        
-        await handle_language_request(callback.message, state)
-        
-    elif callback.data == "save_admittance":
-        await callback.message.delete()
-        await callback.answer()  
-        
-        await handle_post_admittance(callback.message, state)
-
-    elif callback.data == "clear_cart":
-        await callback.message.delete()
-        await callback.answer()  
-        await state.update_data(cart=[])
-        state_data = await state.get_data()
-        await handle_open_cart(callback, state, get_translation(state_data.get("language", "ru"), "cart_cleared"))
-
-    elif callback.data == "come_back":
-        # await callback.message.answer(get_translation(lang, "come_back"))
-        # await callback.answer()
-        await callback.message.delete()
-        await callback.answer()  
-        await state.update_data(selected_services_print=[])
-        await handle_patient(callback.message, state)
-
-    elif callback.data == "print_results":
-        # await callback.message.answer(get_translation(lang, "come_back"))
-        # await callback.answer()
-        await callback.message.delete()
-        await callback.answer()  
-        await handle_code(callback.message, state, customCode=None, service=True)
-        await state.update_data(selected_services_print=[])
-        await handle_patient(callback.message, state)
-
-    elif re.match(r"^\d+$", callback.data):
-        await handle_code(callback.message, state, callback.data)
-
-    elif callback.data.startswith("print_service_"):
-
-        await callback.message.delete()
-        await callback.answer()  # Optional: acknowledge the button press
-
-        doctor_id = callback.data.split("print_service_")[1]
-        state_data = await state.get_data()
-        fetched_doctors = state_data.get("selected_services_print", [])
-
-        if doctor_id in fetched_doctors:
-            fetched_doctors.remove(doctor_id)
-        else:
-            fetched_doctors.append(doctor_id)
 
-        await state.update_data(selected_services_print=fetched_doctors)
+        await select_registration_date(message, state, data, datetime(int(year), int(month), int(day)))
 
-        # Fetch updated services
-        await handle_fetch_services(callback.message, state, True)
+    except Exception as e:
+        logger.debug(f"Bad date {message.text!r}: {e}")
+        today_kb = get_today_keyboard(lang)
+        await message.answer(f"{get_translation(lang, 'select_admission_date')}", reply_markup=today_kb)
 
-        await callback.answer()
-    
-    elif callback.data.startswith("select_hour:"):
 
-        await callback.message.delete()
-        await callback.answer()  # Optional: acknowledge the button press
+@rate_limit(2, burst=2)
+async def handle_services_menu(message: Message, state: FSMContext, data):
+    await handle_fetch_services(message, state)
 
-        time = callback.data.split("select_hour:")[1]
-        state_data = await state.get_data()
-        service = state_data.get("service", {})
 
-        registrationDate = datetime.strptime(f"{service.get('registration_date', '')} {time}", "%Y-%m-%d %H:%M")
-        service['registrationDate'] = registrationDate.isoformat()
-        
-        await state.update_data(service=service)
-        
-        await handle_fetch_admittanceType(callback.message, state)
+async def handle_add_service_menu(message: Message, state: FSMContext, data):
+    lang = data.get("language", "ru")
+    add_service_text = get_translation(lang, "add_serv")
+    add_service_kb = get_add_service_keyboard(lang)
+    await message.answer(add_service_text, reply_markup=add_service_kb)
 
-        await callback.answer()
-    
-    
-    elif callback.data.startswith("admittance_doctor_"):
 
-        await callback.message.delete()
-        await callback.answer()  # Optional: acknowledge the button press
+async def handle_change_lang_menu(message: Message, state: FSMContext, data):
+    await handle_language_request(message, state)
 
-        doctor_id = callback.data.split("admittance_doctor_")[1]
-        state_data = await state.get_data()
-        fetched_doctors = state_data.get("fetched_doctors", [])
-        service = state_data.get("service", {})
 
-        
-        current_doctor = None
-        for doctor in fetched_doctors:
-            if str(doctor["id"]) == doctor_id:
-                current_doctor = doctor
-                break
-        
-        # if current_doctor:
-        service['doctor'] = current_doctor['id']
-        service['doctor_obj'] = current_doctor
-        
+# Steps that consume any text the user sends
+INPUT_STEPS = {
+    "patient_name": handle_patient_name,
+    "phone": handle_phone,
+}
 
-        await state.update_data(service=service, step="registrationDate")
-        
-       
-        calendar = SimpleCalendar()
-        await callback.message.answer(f"{get_translation(state_data.get('language', 'ru'), 'select_admission_date')}", reply_markup=await calendar.start_calendar())
-        await callback.answer()
-        
-    
-    elif callback.data.startswith("admittance_admittanceType_"):
+# Main menu buttons, matched by their label in any language
+MENU_ACTIONS = {
+    **{label: handle_services_menu for label in get_labels("services")},
+    **{label: handle_add_service_menu for label in get_labels("add_service")},
+    **{label: handle_change_lang_menu for label in get_labels("change_lang")},
+}
 
-        await callback.message.delete()
-        await callback.answer()  # Optional: acknowledge the button press
+# Steps that wait for a typed value but still let the menu buttons through
+VALUE_STEPS = {
+    "birthday": handle_birthday,
+    "registrationDate": handle_registration_date,
+}
 
-        adm_type_id = callback.data.split("admittance_admittanceType_")[1]
-        state_data = await state.get_data()
-        service = state_data.get("service", {})
-        fetched_admittanceType = state_data.get("fetched_admittanceType", [])
 
-        
-        current_admType = None
-        for adm_type in fetched_admittanceType:
-            if str(adm_type["id"]) == adm_type_id:
-                current_admType= adm_type
-                break
-        
-        # if current_doctor:
-        service['admittanceType'] = current_admType['id']
-        service['admittanceType_obj'] = current_admType
-        
+def get_step(data) -> str:
+    step = data.get("step", "")
+    # While registering, every text is the patient's name until the birthday step
+    if data.get("add_patient", False) and data.get("phone_number") and step != "birthday":
+        return "patient_name"
+    return step
 
-        await state.update_data(service=service, step="service_confirm")
-        confirm_kb = await get_confirm_keyboard(state)
-        
-        
-        
-        message_text = f"<b>{get_translation(state_data.get('language', 'ru'), 'is_correct')}</b>\n{get_translation(state_data.get('language', 'ru'), 'doctor')}: {get_full_name(service.get('doctor_obj', {}))}\n{get_translation(state_data.get('language', 'ru'), 'admittanceType')}: {get_safe_attribute(service, 'admittanceType_obj.title')} - <b>{float(get_safe_attribute(service, 'admittanceType_obj.amount'))}</b> \n{get_translation(state_data.get('language', 'ru'), 'time')}: {service.get('registrationDate', '')}"
-        
-        await callback.message.answer(f"{message_text}", reply_markup=confirm_kb)
 
-        await callback.answer()
-        
-    elif callback.data in ["male", 'female']:
+@router.message(CommandStart(deep_link=True))
+@rate_limit(10, key="pdf", burst=2)
+async def start_with_code(message: Message, state: FSMContext, command: CommandObject):
+    await handle_code(message, state, customCode=command.args)
 
-        await callback.message.delete()
-        await callback.answer()  # Optional: acknowledge the button press
 
-        state_data = await state.get_data()
-        lang = state_data.get("language", "ru")
-        patient_form = state_data.get("patient_form", {})
-        
-        
+@router.message(CommandStart())
+async def start_command(message: Message, state: FSMContext):
+    data = await state.get_data()
+    await message.answer(
+        f"{get_translation(data.get('language', 'ru'), 'welcome')}",
+        reply_markup=ReplyKeyboardRemove(),
+    )
+    await handle_patient(message, state)
 
-        if callback.data == 'male':
-            patient_form["gender"] = 1
-        else: 
-            patient_form["gender"] = 2
-        
-        await state.update_data(patient_form=patient_form, step="birthday")
-        
-        
-        # calendar = SimpleCalendar()
-        await callback.message.answer(f"{get_translation(lang, "select_birthday")}")
-        
-    elif callback.data == 'cart':
 
-        await callback.message.delete()
-        await callback.answer()  # Optional: acknowledge the button press
+@router.message(Command("reset"))
+async def reset_command(message: Message, state: FSMContext):
+    data = await state.get_data()
+    await message.answer(
+        f"{get_translation(data.get('language', 'ru'), 'reset')}",
+        reply_markup=ReplyKeyboardRemove(),
+    )
 
-        state_data = await state.get_data()
-        lang = state_data.get("language", "ru")
-        patient_form = state_data.get("patient_form", {})
-        
-        await handle_open_cart(callback, state)
-        
-        
+    await state.clear()
+    await handle_language_request(message, state)
 
-        # if callback.data == 'male':
-        #     patient_form["gender"] = 1
-        # else: 
-        #     patient_form["gender"] = 2
-        
-        # await state.update_data(patient_form=patient_form, step="birthday")
-        
-        
-        # # calendar = SimpleCalendar()
-        # await callback.message.answer(f"{get_translation(lang, "select_birthday")}")
-        
-    elif callback.data == "add_service":
 
-        await callback.message.delete()
-        await callback.answer()  # Optional: acknowledge the button press
+@router.message(flags={"resolve_action": lambda message: MENU_ACTIONS.get(message.text)})
+async def start(message: Message, state: FSMContext):
 
-        state_data = await state.get_data()
-        lang = state_data.get("language", "ru")
-        # patient_form = state _data.get("patient_form", {})
-        
-        await state.update_data(service={}, limit=10, offset=0, count=0)
-        
-        await handle_fetch_doctors(callback.message, state)
-    
-    elif callback.data in ["doctor_prev", "doctor_next"]:
-        state_data = await state.get_data()
-        await callback.message.delete()
-        await callback.answer()  # Optional: acknowledge the button pres
-        # patient_form = state _data.get("patient_form", {})
-        
-        if callback.data == "doctor_prev":
-            await state.update_data(offset=state_data.get("offset", 0) - state_data.get("limit", 10))
-        elif callback.data == "doctor_next":
-            await state.update_data(offset=state_data.get("offset", 0) + state_data.get("limit", 10))
-        
-        
-        
-        await handle_fetch_doctors(callback.message, state)
-    
-    elif callback.data in ["admittanceType_prev", "admittanceType_next"]:
-        state_data = await state.get_data()
-        await callback.message.delete()
-        await callback.answer()  # Optional: acknowledge the button pres
-        # patient_form = state _data.get("patient_form", {})
-        
-        if callback.data == "admittanceType_prev":
-            await state.update_data(offset=state_data.get("offset", 0) - state_data.get("limit", 10))
-        elif callback.data == "admittanceType_next":
-            await state.update_data(offset=state_data.get("offset", 0) + state_data.get("limit", 10))
-        
-        
-        
-        await handle_fetch_admittanceType(callback.message, state)
-        
-        
-        
-        
-        
-# @router.callback_query(simple_cal_callback.filter())
-# async def cal_handler(callback: CallbackQuery, callback_data: dict):
-    
-#     print(callback_data, "callback_data")
-#     selected, date = await SimpleCalendar().process_selection(
-#         callback, callback_data
-#     )
-#     if selected:
-#         await callback.message.edit_text(f"✅ Selected: {date}")
-#     else:
-#         await callback.answer()      
+    data = await state.get_data()
+    step = get_step(data)
 
-        
+    handler = INPUT_STEPS.get(step) or MENU_ACTIONS.get(message.text) or VALUE_STEPS.get(step)
+    if handler is not None:
+        await handler(message, state, data)
 
 
 # Handle numeric code (PDF generation)
 # @router.message(F.text.regexp(r"^\d+$"))
 async def handle_code(message: Message, state, customCode=None, service=False):
-    print(message.text, 'code_inside')
     data = await state.get_data()
     lang = data.get("language", 'ru')
     selected_services_print = data.get("selected_services_print", [])
@@ -1670,44 +1293,58 @@ async def handle_code(message: Message, state, customCode=None, service=False):
 
     if customCode:
         code = customCode
-    await message.answer(get_translation(lang, 'finding_results'))
-    
-    print(code, "code")
 
-    ssl_context = get_ssl()
+    if render_queue.is_pending(message.chat.id):
+        await message.answer(get_translation(lang, 'render_in_progress'))
+        return
+
+    finding_text = get_translation(lang, 'finding_results')
+    status_message = await message.answer(finding_text)
+
+    # Edits in the order the queue reported them; 0 (render started) drops the line number
+    edits = asyncio.Lock()
+    shown = {"position": None}
+
+    async def show_queue_position(position):
+        async with edits:
+            if position:
+                await status_message.edit_text(f"{finding_text}\n{get_translation(lang, 'queue_position')}: {position}")
+            elif shown["position"]:
+                await status_message.edit_text(finding_text)
+            shown["position"] = position
 
-    timeout = aiohttp.ClientTimeout(total=10)
+    def queued(render):
+        return lambda: render_queue.run(message.chat.id, render, show_queue_position)
+    
+    logger.debug(f"Result code {code}")
 
     guid = None
     patient_name = None
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        try:
+    try:
 
-            url = (
-                f"{BACK_END_URL}/api/admittance/?q={code}"
-                if not service
-                else f"{BACK_END_URL}/api/admittance-service/chosen?id={selected_services_print}"
-            )
-            async with session.get(url, ssl=ssl_context) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data:
-
-                        if service:
-                            current_obj = data[0]
-                            patient_name = f"{current_obj['patient']['first_name']} {current_obj['patient']['last_name']}"
-                        else:
-                            current_obj = data[0]
-                            guid = current_obj["guid"]
-                            patient_name = f"{current_obj['patient']['first_name']} {current_obj['patient']['last_name']}"
-        except aiohttp.ClientError:
-            print("aiohttp.ClientError")
-            await message.answer(get_translation(lang, 'try_again'))
-            return
-        except asyncio.TimeoutError:
-            print("asyncio.TimeoutError")
-            await message.answer(get_translation(lang, 'request_timeout'))
-            return
+        url = (
+            f"/api/admittance/?q={code}"
+            if not service
+            else f"/api/admittance-service/chosen?id={selected_services_print}"
+        )
+        status, data = await backend.get(url)
+        if status == 200 and data:
+
+            if service:
+                current_obj = data[0]
+                patient_name = f"{current_obj['patient']['first_name']} {current_obj['patient']['last_name']}"
+            else:
+                current_obj = data[0]
+                guid = current_obj["guid"]
+                patient_name = f"{current_obj['patient']['first_name']} {current_obj['patient']['last_name']}"
+    except aiohttp.ClientError:
+        logger.warning("Result lookup failed", exc_info=True)
+        await message.answer(get_translation(lang, 'try_again'))
+        return
+    except asyncio.TimeoutError:
+        logger.warning("Result lookup timed out")
+        await message.answer(get_translation(lang, 'request_timeout'))
+        return
 
     if service:
         if not selected_services_print or not patient_name:
@@ -1719,19 +1356,25 @@ async def handle_code(message: Message, state, customCode=None, service=False):
             await message.answer(get_translation(lang, 'not_found'))
             return
 
-    pdf_path = f"{patient_name}.pdf"
-
-    if service:
-        await generate_pdf_service(selected_services_print, pdf_path)
-
-    else:
-        await generate_pdf(guid, pdf_path)
-
     try:
-        await message.answer_document(document=FSInputFile(pdf_path))
-        os.remove(pdf_path)
+        if service:
+            await send_result_pdf(
+                message,
+                PdfCache.key(service_ids=selected_services_print.split(",")),
+                queued(lambda: generate_pdf_service(selected_services_print)),
+                f"{patient_name}.pdf",
+            )
+
+        else:
+            await send_result_pdf(
+                message, PdfCache.key(guid=guid), queued(lambda: generate_pdf(guid)), f"{patient_name}.pdf"
+            )
+    except RenderInProgressError:
+        await message.answer(get_translation(lang, 'render_in_progress'))
+    except QueueFullError:
+        await message.answer(get_translation(lang, 'render_busy'))
     except Exception as e:
-        print(e)
+        logger.exception("Result PDF was not generated")
         await message.answer(get_translation(lang, 'pdf_not_generated'))
 
 
@@ -1,2 +1,31 @@
 from . import default
 from . import inline
+
+from keyboards.default.main import get_main_keyboard, get_request_contact_keyboard, get_services_print_keyboard
+from keyboards.inline.main import (
+    get_add_service_keyboard,
+    get_cart_keyboard,
+    get_come_back_keyboard,
+    get_confirm_keyboard,
+    get_gender_keyboard,
+    get_language_kb,
+    get_today_keyboard,
+)
+from utils.translations import LOCALES
+
+
+def build_keyboards():
+    """Fill the per-language keyboard caches before the first update arrives."""
+    get_language_kb()
+    for lang in LOCALES:
+        get_main_keyboard(lang)
+        get_request_contact_keyboard(lang)
+        get_services_print_keyboard(lang)
+        get_confirm_keyboard(lang)
+        get_gender_keyboard(lang)
+        get_today_keyboard(lang)
+        get_add_service_keyboard(lang)
+        get_cart_keyboard(lang, False)
+        get_cart_keyboard(lang, True)
+        get_come_back_keyboard(lang)
+        get_come_back_keyboard(lang, "come_back_add_service")
@@ -10,15 +10,14 @@ from aiogram.types import (
     ReplyKeyboardRemove,
 )
 
-
-from aiogram.fsm.context import FSMContext
+from functools import lru_cache
 
 from utils.helpers import get_translation
 
-async def get_request_contact_keyboard(state: FSMContext) -> InlineKeyboardMarkup:
-    data = await state.get_data()
-    lang = data.get("language", "ru")
 
+# Keyboards are built once per language and shared; aiogram models are immutable
+@lru_cache(maxsize=None)
+def get_request_contact_keyboard(lang) -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(
         keyboard=[
             [
@@ -36,10 +35,8 @@ async def get_request_contact_keyboard(state: FSMContext) -> InlineKeyboardMarku
 
 
 
-async def get_services_print_keyboard(state: FSMContext) -> InlineKeyboardMarkup:
-    data = await state.get_data()
-    lang = data.get("language", "ru")
-
+@lru_cache(maxsize=None)
+def get_services_print_keyboard(lang) -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(
         keyboard=[
             [
@@ -56,3 +53,33 @@ async def get_services_print_keyboard(state: FSMContext) -> InlineKeyboardMarkup
         resize_keyboard=True,
         one_time_keyboard=True,
     )
+
+
+@lru_cache(maxsize=None)
+def get_main_keyboard(lang) -> ReplyKeyboardMarkup:
+    services = get_translation(lang, "services")
+    add_service = get_translation(lang, "add_service")
+    change_lang = get_translation(lang, "change_lang")
+
+    return ReplyKeyboardMarkup(
+        keyboard=[
+            [
+                KeyboardButton(
+                    text=f"{services}",
+                    # callback_data="services"
+                ),
+                KeyboardButton(
+                    text=f"{add_service}",
+                    # callback_data="add_service"
+                ),
+            ],
+            [
+                KeyboardButton(
+                    text=f"{change_lang}",
+                    # callback_data="change_lang"
+                )
+            ],
+        ],
+        resize_keyboard=True,
+        # one_time_keyboard=True,
+    )
@@ -0,0 +1,33 @@
+from aiogram.filters.callback_data import CallbackData
+
+
+class LanguageCallback(CallbackData, prefix="lang"):
+    code: str
+
+
+class PrintServiceCallback(CallbackData, prefix="print_service"):
+    id: int
+
+
+class DoctorCallback(CallbackData, prefix="doctor"):
+    id: int
+
+
+class AdmittanceTypeCallback(CallbackData, prefix="adm_type"):
+    id: int
+
+
+class HourCallback(CallbackData, prefix="hour"):
+    hour: int
+    minute: int
+
+
+class SlotCallback(CallbackData, prefix="slot"):
+    day: str  # YYYYMMDD
+    hour: int
+    minute: int
+
+
+class PageCallback(CallbackData, prefix="page"):
+    target: str  # "doctor" or "admittanceType"
+    step: int  # -1 previous page, 1 next page
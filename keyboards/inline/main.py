@@ -10,16 +10,17 @@ from aiogram.types import (
     ReplyKeyboardRemove,
 )
 
+from functools import lru_cache
 
-from aiogram.fsm.context import FSMContext
+from aiogram_calendar import SimpleCalendar
 
+from keyboards.inline.callbacks import LanguageCallback
 from utils.helpers import get_translation
 
 
-async def get_confirm_keyboard(state: FSMContext) -> InlineKeyboardMarkup:
-    data = await state.get_data()
-    lang = data.get("language", "ru")
-
+# Keyboards are built once per language and shared; aiogram models are immutable
+@lru_cache(maxsize=None)
+def get_confirm_keyboard(lang) -> InlineKeyboardMarkup:
     yes_text = get_translation(lang, "yes")
     no_text = get_translation(lang, "no")
 
@@ -35,10 +36,8 @@ async def get_confirm_keyboard(state: FSMContext) -> InlineKeyboardMarkup:
     )
 
 
-async def get_gender_keyboard(state: FSMContext) -> InlineKeyboardMarkup:
-    data = await state.get_data()
-    lang = data.get("language", "ru")
-
+@lru_cache(maxsize=None)
+def get_gender_keyboard(lang) -> InlineKeyboardMarkup:
     male = get_translation(lang, "male")
     female = get_translation(lang, "female")
 
@@ -52,10 +51,8 @@ async def get_gender_keyboard(state: FSMContext) -> InlineKeyboardMarkup:
     )
 
 
-async def get_today_keyboard(state: FSMContext) -> InlineKeyboardMarkup:
-    data = await state.get_data()
-    lang = data.get("language", "ru")
-
+@lru_cache(maxsize=None)
+def get_today_keyboard(lang) -> InlineKeyboardMarkup:
     today = get_translation(lang, "today")
 
     return InlineKeyboardMarkup(
@@ -63,17 +60,14 @@ async def get_today_keyboard(state: FSMContext) -> InlineKeyboardMarkup:
     )
 
 
-async def get_cart_keyboard(state: FSMContext) -> InlineKeyboardMarkup:
-    data = await state.get_data()
-    lang = data.get("language", "ru")
-    cart_services = data.get("cart", [])
-
+@lru_cache(maxsize=None)
+def get_cart_keyboard(lang, has_services: bool) -> InlineKeyboardMarkup:
     save_admittance = get_translation(lang, "save_admittance")
     add_serv = get_translation(lang, "add_serv")
     delete_serv = get_translation(lang, "delete_service")
     clear_cart = get_translation(lang, "clear_cart")
 
-    if not cart_services:
+    if not has_services:
         return InlineKeyboardMarkup(
             inline_keyboard=[
                 [
@@ -105,10 +99,8 @@ async def get_cart_keyboard(state: FSMContext) -> InlineKeyboardMarkup:
     )
 
 
-async def get_add_service_keyboard(state: FSMContext) -> InlineKeyboardMarkup:
-    data = await state.get_data()
-    lang = data.get("language", "ru")
-
+@lru_cache(maxsize=None)
+def get_add_service_keyboard(lang) -> InlineKeyboardMarkup:
     add_serv = get_translation(lang, "add_serv")
     cart = get_translation(lang, "cart")
 
@@ -122,12 +114,8 @@ async def get_add_service_keyboard(state: FSMContext) -> InlineKeyboardMarkup:
     )
 
 
-async def get_come_back_keyboard(
-    state: FSMContext, call_data="come_back"
-) -> InlineKeyboardMarkup:
-    data = await state.get_data()
-    lang = data.get("language", "ru")
-
+@lru_cache(maxsize=None)
+def get_come_back_keyboard(lang, call_data="come_back") -> InlineKeyboardMarkup:
     come_back = get_translation(lang, "come_back")
 
     return InlineKeyboardMarkup(
@@ -138,11 +126,25 @@ async def get_come_back_keyboard(
 
 
 # Keyboards
+@lru_cache(maxsize=None)
 def get_language_kb():
     return InlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text="O'zbek", callback_data="uz")],
-            [InlineKeyboardButton(text="Русский", callback_data="ru")],
-            [InlineKeyboardButton(text="English", callback_data="en")],
+            [InlineKeyboardButton(text="O'zbek", callback_data=LanguageCallback(code="uz").pack())],
+            [InlineKeyboardButton(text="Русский", callback_data=LanguageCallback(code="ru").pack())],
+            [InlineKeyboardButton(text="English", callback_data=LanguageCallback(code="en").pack())],
+        ]
+    )
+
+
+async def get_admission_calendar(lang) -> InlineKeyboardMarkup:
+    """Month calendar for the admission date, with a shortcut to the nearest free times."""
+    calendar = await SimpleCalendar().start_calendar()
+    next_free = get_translation(lang, "next_free_slots")
+
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            *calendar.inline_keyboard,
+            [InlineKeyboardButton(text=f"🔎 {next_free}", callback_data="next_free")],
         ]
     )
@@ -1,14 +1,76 @@
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
-from aiogram.fsm.storage.memory import MemoryStorage
 
 from data import config
+from utils.backend import BackendClient
+from utils.browser_pool import BrowserPool
+from utils.cache import TTLCache
+from utils.db_api.storage import build_isolation, build_storage
+from utils.pdf_cache import PdfCache
+from utils.render_client import RenderClient
+from utils.render_queue import RenderQueue
+from utils.slots import SlotGrid, clock_minutes
 
 bot = Bot(
     token=config.BOT_TOKEN,
     default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
 
-storage = MemoryStorage()
-dp = Dispatcher(storage=storage)
+storage = build_storage()
+dp = Dispatcher(storage=storage, events_isolation=build_isolation(storage))
+
+browser_pool = BrowserPool(
+    size=config.PDF_POOL_SIZE,
+    max_renders=config.PDF_BROWSER_MAX_RENDERS,
+)
+
+backend = BackendClient(
+    config.BACK_END_URL,
+    timeout=config.BACKEND_TIMEOUT,
+    limit_per_host=config.BACKEND_LIMIT_PER_HOST,
+    keepalive_timeout=config.BACKEND_KEEPALIVE,
+    dns_ttl=config.BACKEND_DNS_TTL,
+    retries=config.BACKEND_RETRIES,
+    retry_backoff=config.BACKEND_RETRY_BACKOFF,
+    breaker_threshold=config.BACKEND_BREAKER_THRESHOLD,
+    breaker_reset=config.BACKEND_BREAKER_RESET,
+    timeouts=config.BACKEND_TIMEOUTS,
+    hedge=config.BACKEND_HEDGE,
+)
+
+# Renders go to render_worker.py processes when any are configured
+render_client = (
+    RenderClient(config.RENDER_WORKER_URLS, timeout=config.RENDER_WORKER_TIMEOUT)
+    if config.RENDER_WORKER_URLS
+    else None
+)
+
+# Doctor and admittance-type pages, keyed by (endpoint, limit, offset, doctor)
+catalog_cache = TTLCache(ttl=config.CATALOG_CACHE_TTL, maxsize=config.CATALOG_CACHE_SIZE, name="catalog")
+
+# Free-slot bitmaps of a doctor's day, keyed by (doctor, "YYYY-MM-DD")
+timetable_cache = TTLCache(ttl=config.TIMETABLE_CACHE_TTL, maxsize=config.TIMETABLE_CACHE_SIZE, name="timetable")
+
+# Patient summary (id, guid, names) by normalized phone number
+patient_cache = TTLCache(ttl=config.PATIENT_CACHE_TTL, maxsize=config.PATIENT_CACHE_SIZE, name="patient")
+
+# Outcome of each admittance submission, keyed by its idempotency key
+submission_cache = TTLCache(ttl=config.ADMITTANCE_IDEMPOTENCY_TTL, maxsize=1024, name="submission")
+
+# Rendered result PDFs and their Telegram file_ids
+pdf_cache = PdfCache(
+    config.PDF_CACHE_DIR,
+    max_bytes=config.PDF_CACHE_MAX_MB * 1024 * 1024,
+    ttl=config.PDF_CACHE_TTL,
+)
+
+# At most RENDER_WORKERS renders at a time, one job per user
+render_queue = RenderQueue(workers=config.RENDER_WORKERS, max_depth=config.RENDER_QUEUE_MAX)
+
+# Bookable slots of a doctor's working day
+slot_grid = SlotGrid(
+    day_start=clock_minutes(config.WORK_DAY_START),
+    day_end=clock_minutes(config.WORK_DAY_END),
+    slot_minutes=config.SLOT_MINUTES,
+)
@@ -40,7 +40,6 @@ EN = {
     "select_admittance_type": "Choose type of appointment",
     "admittanceType": "Type of appointment",
     "doctor": "Doctor",
-    "date": "Date",
     "time": "Time",
     "added_to_cart": "Service added to cart",
     "service_saved": "Service saved",
@@ -59,5 +58,14 @@ EN = {
     "error_try": "An error occurred, please try again!",
     "not_found": "Data not found!",
     "pdf_not_generated": "PDF was not generated!",
-    "uncorrect_date" : "Uncorrect date"
+    "uncorrect_date" : "Uncorrect date",
+    "queue_position": "Your place in the queue",
+    "render_in_progress": "Your document is already being prepared, please wait.",
+    "render_busy": "Too many requests right now, please try again in a minute.",
+    "too_many_requests": "Too many requests, please slow down.",
+    "cart_cleared": "Cart cleared",
+    "next_free_slots": "Nearest free time",
+    "nearest_free_slots": "Nearest free time:",
+    "no_free_slots": "No free time in the coming days, please choose a date.",
+    "admittance_in_progress": "Your booking is already being saved, please wait."
 }
@@ -40,7 +40,6 @@ RU = {
     "select_admittance_type": "Выберите тип приема",
     "admittanceType": "Тип приема",
     "doctor": "Врач",
-    "date": "Дата",
     "time": "Время",
     "added_to_cart": "Услуга добавлена в корзину",
     "service_saved": "Услуга сохранена",
@@ -59,5 +58,14 @@ RU = {
     'error_try' : "Произошла ошибка, пожалуйста, попробуйте снова!",
     "not_found": "Данные не найдены!",
     "pdf_not_generated": "PDF не был создан!",
-    "uncorrect_date" : "Неправильная дата"
+    "uncorrect_date" : "Неправильная дата",
+    "queue_position": "Ваше место в очереди",
+    "render_in_progress": "Ваш документ уже готовится, пожалуйста, подождите.",
+    "render_busy": "Сейчас слишком много запросов, попробуйте через минуту.",
+    "too_many_requests": "Слишком много запросов, пожалуйста, подождите.",
+    "cart_cleared": "Корзина очищена",
+    "next_free_slots": "Ближайшее свободное время",
+    "nearest_free_slots": "Ближайшее свободное время:",
+    "no_free_slots": "В ближайшие дни свободного времени нет, выберите дату.",
+    "admittance_in_progress": "Ваша запись уже сохраняется, пожалуйста, подождите."
 }
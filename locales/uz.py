@@ -103,7 +103,6 @@ UZ = {
     "select_admittance_type": "Қабул турини танланг",
     "admittanceType": "Қабул тури",
     "doctor": "Шифокор",
-    "date": "Сана",
     "time": "Вақт",
     "added_to_cart": "Хизмат саватга қўшилди",
     "canceled": "Бекор қилинди",
@@ -122,5 +121,14 @@ UZ = {
     'error_try' : "Хатолик юз берди, илтимос қайта уриниб кўринг!",
     'not_found' : "Маълумот топилмади!",
     'pdf_not_generated' : "PDF яратилмади!",
-    "uncorrect_date" : "Нотўғри сана"
+    "uncorrect_date" : "Нотўғри сана",
+    "queue_position": "Навбатдаги ўрнингиз",
+    "render_in_progress": "Ҳужжатингиз тайёрланмоқда, илтимос кутинг.",
+    "render_busy": "Ҳозир сўровлар жуда кўп, бир дақиқадан сўнг қайта уриниб кўринг.",
+    "too_many_requests": "Сўровлар жуда кўп, илтимос бироз кутинг.",
+    "cart_cleared": "Сават тозаланди",
+    "next_free_slots": "Энг яқин бўш вақт",
+    "nearest_free_slots": "Энг яқин бўш вақтлар:",
+    "no_free_slots": "Яқин кунларда бўш вақт йўқ, илтимос санани танланг.",
+    "admittance_in_progress": "Ёзилишингиз сақланмоқда, илтимос кутинг."
 }
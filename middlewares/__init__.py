@@ -1,8 +1,22 @@
 from aiogram import Dispatcher
 
-from loader import dp
+from data import config
 from .throttling import ThrottlingMiddleware
+from .timing import HandlerInfoMiddleware, UpdateLoggingMiddleware
 
 
-if __name__ == "middlewares":
-    dp.middleware.setup(ThrottlingMiddleware())
+def setup_middlewares(dp: Dispatcher):
+    dp.update.outer_middleware(UpdateLoggingMiddleware())
+    handler_info = HandlerInfoMiddleware()
+    dp.message.middleware(handler_info)
+    dp.callback_query.middleware(handler_info)
+
+    throttling = ThrottlingMiddleware(
+        dp.storage,
+        rate=config.THROTTLE_RATE,
+        burst=config.THROTTLE_BURST,
+        # Only Redis is worth a round trip per update: it is the storage shared by several workers
+        shared=config.FSM_STORAGE == "redis",
+    )
+    dp.message.middleware(throttling)
+    dp.callback_query.middleware(throttling)
@@ -1,37 +1,116 @@
-import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
 
-from aiogram import types, Dispatcher
-from aiogram.dispatcher import DEFAULT_RATE_LIMIT
-from aiogram.dispatcher.handler import CancelHandler, current_handler
-from aiogram.dispatcher.middlewares import BaseMiddleware
-from aiogram.utils.exceptions import Throttled
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import extract_flags_from_object, get_flag
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from aiogram.types import CallbackQuery, TelegramObject
+
+from utils.helpers import get_translation
+from utils.timings import annotate
+
+THROTTLING_DESTINY = "throttling"
 
 
 class ThrottlingMiddleware(BaseMiddleware):
     """
-    Simple middleware
+    Anti-flood with token buckets. They are kept in process memory, or,
+    with ``shared=True`` (Redis), in the FSM storage so the limits hold
+    across all bot workers.
+
+    Every update needs a token from the user's own bucket (one token per
+    ``rate`` seconds, up to ``burst``). Handlers marked with ``@rate_limit``
+    also need one from the bucket of their action; tokens are only spent
+    when both buckets have one. Catch-all handlers that dispatch through a
+    table set the ``resolve_action`` flag to name the function that will
+    actually run.
     """
 
-    def __init__(self, limit=DEFAULT_RATE_LIMIT, key_prefix='antiflood_'):
-        self.rate_limit = limit
-        self.prefix = key_prefix
-        super(ThrottlingMiddleware, self).__init__()
-
-    async def on_process_message(self, message: types.Message, data: dict):
-        handler = current_handler.get()
-        dispatcher = Dispatcher.get_current()
-        if handler:
-            limit = getattr(handler, "throttling_rate_limit", self.rate_limit)
-            key = getattr(handler, "throttling_key", f"{self.prefix}_{handler.__name__}")
-        else:
-            limit = self.rate_limit
-            key = f"{self.prefix}_message"
-        try:
-            await dispatcher.throttle(key, rate=limit)
-        except Throttled as t:
-            await self.message_throttled(message, t)
-            raise CancelHandler()
-
-    async def message_throttled(self, message: types.Message, throttled: Throttled):
-        if throttled.exceeded_count <= 5:
-            await message.reply("Too many requests!")
+    def __init__(
+        self, storage: BaseStorage, rate: float = 0.5, burst: int = 5, shared: bool = False, max_users: int = 10000
+    ):
+        self.storage = storage
+        self.rate = rate
+        self.burst = burst
+        self.shared = shared
+        self.max_users = max_users
+        self._local: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        key = StorageKey(bot_id=data["bot"].id, chat_id=user.id, user_id=user.id, destiny=THROTTLING_DESTINY)
+        buckets = await self._load(key)
+        now = time.time()
+
+        limits = [("default", self.rate, self.burst)]
+        limit = self._action_limit(event, data)
+        if limit:
+            limits.append((limit["key"], limit["limit"], limit["burst"]))
+        tokens = [self._tokens(buckets, name, rate, burst, now) for name, rate, burst in limits]
+
+        allowed = all(available >= 1 for available in tokens)
+        if allowed:
+            for (name, _, _), available in zip(limits, tokens):
+                buckets[name] = (available - 1, now)
+
+        # Tell the user once per streak of throttled updates, not on every one
+        notify = not allowed and not buckets.get("notified")
+        streak_changed = bool(buckets.get("notified")) != (not allowed)
+        buckets["notified"] = not allowed
+        if allowed or streak_changed:
+            await self._save(key, buckets)
+
+        if allowed:
+            return await handler(event, data)
+        annotate(status="throttled")
+        await self.throttled(event, data, notify)
+
+    async def _load(self, key: StorageKey) -> Dict[str, Any]:
+        if self.shared:
+            return await self.storage.get_data(key)
+
+        buckets = self._local.pop(key.user_id, None) or {}
+        self._local[key.user_id] = buckets
+        while len(self._local) > self.max_users:
+            self._local.popitem(last=False)
+        return buckets
+
+    async def _save(self, key: StorageKey, buckets: Dict[str, Any]):
+        # Local buckets were changed in place
+        if self.shared:
+            await self.storage.set_data(key, buckets)
+
+    @staticmethod
+    def _tokens(buckets: Dict[str, Any], name: str, rate: float, burst: int, now: float) -> float:
+        tokens, updated_at = buckets.get(name, (burst, now))
+        return min(burst, tokens + (now - updated_at) / rate)
+
+    @staticmethod
+    def _action_limit(event: TelegramObject, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        resolve_action = get_flag(data, "resolve_action")
+        if resolve_action is None:
+            return get_flag(data, "rate_limit")
+
+        action = resolve_action(event)
+        return extract_flags_from_object(action).get("rate_limit") if action else None
+
+    async def throttled(self, event: TelegramObject, data: Dict[str, Any], notify: bool):
+        text = None
+        if notify:
+            state = data.get("state")
+            lang = (await state.get_data()).get("language", "ru") if state else "ru"
+            text = get_translation(lang, "too_many_requests")
+
+        if isinstance(event, CallbackQuery):
+            await event.answer(text)
+        elif text:
+            await event.reply(text)
@@ -0,0 +1,103 @@
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.dispatcher.flags import get_flag
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import CallbackQuery, TelegramObject, Update
+
+from utils.db_api.storage import update_dropped
+from utils.helpers import get_translation
+from utils.metrics import CALLBACK_ACTIONS, UPDATE_DURATION, UPDATES, active_users
+from utils.timings import annotate, finish_record, start_record
+
+logger = logging.getLogger("bot.updates")
+
+
+class UpdateLoggingMiddleware(BaseMiddleware):
+    """
+    Outer middleware on ``dp.update``: times every update end to end and
+    logs one structured line with the update type, handler, status, FSM step
+    and the backend/render durations collected while it was handled.
+    The same outcome feeds the update metrics.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is not None:
+            active_users.seen(user.id)
+        token = start_record(update_id=event.update_id, type=event.event_type, user=user.id if user else None)
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            if update_dropped():
+                # Too many updates of this user pending already (BoundedIsolation)
+                status = "dropped"
+                await self.dropped(event, data)
+                return UNHANDLED
+            result = await handler(event, data)
+            if result is UNHANDLED:
+                status = "unhandled"
+            return result
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            record = finish_record(token)
+            record.setdefault("status", status)
+            record["duration_ms"] = round(elapsed * 1000, 1)
+            logger.info("update", extra={"fields": record})
+
+            handler_name = record.get("handler", "")
+            UPDATES.inc(type=record["type"], handler=handler_name, status=record["status"])
+            UPDATE_DURATION.observe(elapsed, type=record["type"], handler=handler_name)
+
+    @staticmethod
+    async def dropped(event: Update, data: Dict[str, Any]):
+        user = data.get("event_from_user")
+        logger.info(f"Update {event.update_id} of user {user.id if user else None} dropped: too many pending")
+
+        # Stop the button spinner and say why nothing happened
+        if event.callback_query is not None:
+            state = data.get("state")
+            lang = (await state.get_data()).get("language", "ru") if state is not None else "ru"
+            try:
+                await event.callback_query.answer(get_translation(lang, "too_many_requests"))
+            except TelegramAPIError as err:
+                logger.warning(f"Could not answer dropped callback query: {err}")
+
+
+class HandlerInfoMiddleware(BaseMiddleware):
+    """
+    Inner middleware: names the handler that runs (the ``resolve_action``
+    target for catch-all handlers) in the record and counts callback
+    actions by that name, along with the user's FSM state as ``step``.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        target = data["handler"].callback
+        resolve = get_flag(data, "resolve_action")
+        if resolve is not None:
+            target = resolve(event) or target
+        name = getattr(target, "__name__", str(target))
+        annotate(handler=name)
+        if isinstance(event, CallbackQuery):
+            CALLBACK_ACTIONS.inc(action=name)
+
+        # FSMContextMiddleware has already read the state name: no storage call
+        annotate(step=data.get("raw_state") or None)
+
+        return await handler(event, data)
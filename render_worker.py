@@ -0,0 +1,77 @@
+"""
+Standalone PDF renderer, so Chromium runs outside the bot process.
+
+    python render_worker.py --socket /run/dclinics/render-1.sock
+    python render_worker.py --port 8081
+
+Start as many as there are cores to spare and list them in
+RENDER_WORKER_URLS (``unix:/run/dclinics/render-1.sock,http://127.0.0.1:8081``);
+without it the bot renders in its own process as before.
+
+POST /render  {"guid": "..."} or {"ids": "1,2"}  ->  application/pdf
+GET  /health                                     ->  ok
+"""
+import argparse
+
+from aiohttp import web
+
+from data import config
+from utils.browser_pool import BrowserPool
+from utils.pdf_render import render_pdf
+
+POOL = web.AppKey("pool", BrowserPool)
+
+
+async def handle_render(request: web.Request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text="Body must be JSON")
+
+    guid = body.get("guid") if isinstance(body, dict) else None
+    ids = body.get("ids") if isinstance(body, dict) else None
+    if not guid and not ids:
+        raise web.HTTPBadRequest(text="guid or ids is required")
+
+    pdf = await render_pdf(request.app[POOL], guid=guid, ids=ids)
+    return web.Response(body=pdf, content_type="application/pdf")
+
+
+async def handle_health(request: web.Request):
+    return web.Response(text="ok")
+
+
+def build_app(pool_size: int) -> web.Application:
+    app = web.Application()
+    app[POOL] = BrowserPool(size=pool_size, max_renders=config.PDF_BROWSER_MAX_RENDERS)
+
+    async def on_startup(app):
+        await app[POOL].start()
+
+    async def on_cleanup(app):
+        await app[POOL].stop()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_post("/render", handle_render)
+    app.router.add_get("/health", handle_health)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--socket", help="listen on this unix socket")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--pool-size", type=int, default=config.PDF_POOL_SIZE, help="renders at a time")
+    args = parser.parse_args()
+
+    app = build_app(args.pool_size)
+    if args.socket:
+        web.run_app(app, path=args.socket)
+    else:
+        web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import asyncio
+
+from utils.backend import BackendClient
+from utils.metrics import BACKEND_DURATION
+
+
+class _Response:
+    status = 200
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    async def __aenter__(self):
+        await asyncio.sleep(self.delay)
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def json(self):
+        return {"delay": self.delay}
+
+
+class _Session:
+    closed = False
+
+    def __init__(self, delays):
+        self.delays = list(delays)
+
+    def request(self, method, url, **kwargs):
+        return _Response(self.delays.pop(0))
+
+
+def test_losing_hedged_request_is_not_recorded_as_error():
+    async def run():
+        client = BackendClient("http://backend", hedge={"GET /api/hedged": 0.01})
+        client._session = _Session([1, 0])
+
+        assert await client.get("/api/hedged") == (200, {"delay": 0})
+        await asyncio.sleep(0)  # let the cancelled request finish unwinding
+
+        statuses = [str(key[1]) for key in BACKEND_DURATION._values if key[0] == "GET /api/hedged"]
+        assert statuses == ["200"]
+
+    asyncio.run(run())
@@ -0,0 +1,53 @@
+import asyncio
+from datetime import datetime
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.fsm.storage.memory import MemoryStorage, SimpleEventIsolation
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+from middlewares import setup_middlewares
+from utils.db_api.storage import BoundedIsolation
+
+USER = User(id=5, is_bot=False, first_name="a")
+
+
+def _callback_update(update_id):
+    message = Message(message_id=1, date=datetime.now(), chat=Chat(id=USER.id, type="private"), text="x")
+    return Update(
+        update_id=update_id,
+        callback_query=CallbackQuery(id=str(update_id), from_user=USER, chat_instance="c", message=message, data="x"),
+    )
+
+
+def test_updates_over_the_cap_are_dropped_and_answered(monkeypatch):
+    answered = []
+
+    async def answer(self, text=None, **kwargs):
+        answered.append((self.id, text))
+
+    monkeypatch.setattr(CallbackQuery, "answer", answer)
+
+    async def run():
+        dp = Dispatcher(storage=MemoryStorage(), events_isolation=BoundedIsolation(SimpleEventIsolation(), 2))
+        router = Router()
+        handled = []
+
+        @router.callback_query()
+        async def slow(callback):
+            await asyncio.sleep(0.05)
+            handled.append(callback.id)
+
+        dp.include_router(router)
+        setup_middlewares(dp)
+        bot = Bot("1:x")
+        try:
+            await asyncio.gather(*(dp.feed_update(bot, _callback_update(i)) for i in range(5)))
+        finally:
+            await bot.session.close()
+
+        assert sorted(handled) == ["0", "1"]
+        assert sorted(callback_id for callback_id, _ in answered) == ["2", "3", "4"]
+        assert all(text for _, text in answered)
+        assert not dp.fsm.events_isolation._pending
+
+    asyncio.run(run())
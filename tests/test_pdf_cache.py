@@ -0,0 +1,24 @@
+import asyncio
+
+from utils.pdf_cache import PdfCache
+
+
+def test_invalidate_results_by_guid_and_service_id(tmp_path):
+    async def run():
+        cache = PdfCache(str(tmp_path), max_bytes=10 ** 6, ttl=60)
+        keys = {
+            "guid": PdfCache.key(guid="g1"),
+            "with_12": PdfCache.key(service_ids=[12, 15]),
+            "with_120": PdfCache.key(service_ids=[120]),
+        }
+        for key in keys.values():
+            await cache.put_pdf(key, b"%PDF")
+            await cache.set_file_id(key, "file")
+
+        assert await cache.invalidate_results(guid="g1", service_ids=["12"]) == 2
+
+        assert await cache.get_pdf(keys["guid"]) is None
+        assert await cache.get_file_id(keys["with_12"]) is None
+        assert await cache.get_pdf(keys["with_120"]) == b"%PDF"
+
+    asyncio.run(run())
@@ -0,0 +1,75 @@
+import random
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Set
+
+from utils.slots import SlotGrid
+
+DAY = date(2025, 3, 14)
+
+
+# The string-set code SlotGrid replaced (half-hour slots), kept as the reference
+def _overlapping_slots(start: datetime, end: datetime) -> Set[str]:
+    minute = 0 if start.minute < 30 else 30
+    slot = start.replace(minute=minute, second=0, microsecond=0)
+    if slot > start:
+        slot -= timedelta(minutes=30)
+
+    out = set()
+    while slot < end:
+        slot_end = slot + timedelta(minutes=30)
+        if slot_end > start and slot < end:
+            out.add(f"{slot.hour:02d}:{'00' if slot.minute == 0 else '30'}")
+        slot += timedelta(minutes=30)
+    return out
+
+
+def _blocked_labels(reserves: List[Dict], services: List[Dict]) -> Set[str]:
+    blocked = set()
+    for service in services:
+        registered = datetime.fromisoformat(service["registrationDate"])
+        blocked.add(f"{registered.hour:02d}:{'00' if registered.minute < 30 else '30'}")
+    for reserve in reserves:
+        start, end = datetime.fromisoformat(reserve["start"]), datetime.fromisoformat(reserve["end"])
+        if end > start:
+            blocked |= _overlapping_slots(start, end)
+    return blocked
+
+
+def _moment(rng: random.Random) -> datetime:
+    # Same day, with seconds and microseconds
+    return datetime.combine(DAY, datetime.min.time()) + timedelta(
+        hours=rng.randint(6, 19), minutes=rng.randint(0, 59), seconds=rng.randint(0, 59),
+        microseconds=rng.choice([0, rng.randint(1, 999999)]),
+    )
+
+
+def _timetable(rng: random.Random):
+    reserves = []
+    for _ in range(rng.randint(0, 4)):
+        start = _moment(rng)
+        end = min(start + timedelta(minutes=rng.randint(1, 120), seconds=rng.randint(0, 59)),
+                  datetime.combine(DAY, datetime.max.time()))
+        reserves.append({"start": start.isoformat(), "end": end.isoformat()})
+    services = [{"registrationDate": _moment(rng).isoformat()} for _ in range(rng.randint(0, 3))]
+    return reserves, services
+
+
+def test_free_mask_matches_set_based_slots_with_seconds():
+    grid = SlotGrid(8 * 60, 18 * 60, 30)
+    rng = random.Random(18)
+
+    for _ in range(3000):
+        reserves, services = _timetable(rng)
+        blocked = _blocked_labels(reserves, services)
+        expected = [slot for slot in map(grid.slot_time, range(grid.size)) if f"{slot:%H:%M}" not in blocked]
+
+        assert grid.free_times(grid.free_mask(reserves, services, DAY)) == expected, (reserves, services)
+
+
+def test_reserve_ending_seconds_into_a_slot_blocks_it():
+    grid = SlotGrid(8 * 60, 18 * 60, 30)
+    reserves = [{"start": "2025-03-14T14:00:00", "end": "2025-03-14T14:30:15"}]
+
+    free = grid.free_times(grid.free_mask(reserves, [], DAY))
+
+    assert all(f"{slot:%H:%M}" not in ("14:00", "14:30") for slot in free)
@@ -0,0 +1,51 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import Chat, Message, User
+
+from middlewares.throttling import ThrottlingMiddleware
+from utils.misc import rate_limit
+
+USER = User(id=7, is_bot=False, first_name="a")
+
+
+@rate_limit(60, key="pdf")
+async def limited(message):
+    return "limited"
+
+
+async def free(message):
+    return "free"
+
+
+def _feed(middleware, callback):
+    handler = HandlerObject(callback=callback)
+    message = Message(message_id=1, date=datetime.now(), chat=Chat(id=USER.id, type="private"), from_user=USER, text="x")
+    data = {"bot": SimpleNamespace(id=1), "event_from_user": USER, "handler": handler}
+
+    async def call(event, data):
+        return await callback(event)
+
+    async def throttled(event, data, notify):
+        return None
+
+    middleware.throttled = throttled
+    return middleware(call, message, data)
+
+
+def test_rejected_action_does_not_spend_the_default_bucket():
+    async def run():
+        middleware = ThrottlingMiddleware(MemoryStorage(), rate=60, burst=3)
+
+        assert await _feed(middleware, limited) == "limited"
+        # The pdf bucket is empty now: these are refused without touching the default bucket
+        for _ in range(5):
+            assert await _feed(middleware, limited) is None
+        assert await _feed(middleware, free) == "free"
+        assert await _feed(middleware, free) == "free"
+        assert await _feed(middleware, free) is None
+
+    asyncio.run(run())
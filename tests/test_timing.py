@@ -0,0 +1,39 @@
+import asyncio
+import logging
+from datetime import datetime
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import Chat, Message, Update, User
+
+from middlewares import setup_middlewares
+
+USER = User(id=9, is_bot=False, first_name="a")
+
+
+def test_update_line_has_the_fsm_step_at_info(caplog):
+    async def run():
+        storage = MemoryStorage()
+        dp = Dispatcher(storage=storage)
+        router = Router()
+
+        @router.message()
+        async def echo(message):
+            pass
+
+        dp.include_router(router)
+        setup_middlewares(dp)
+        bot = Bot("1:x")
+        await storage.set_state(StorageKey(bot_id=bot.id, chat_id=USER.id, user_id=USER.id), "Form:phone")
+        message = Message(message_id=1, date=datetime.now(), chat=Chat(id=USER.id, type="private"), from_user=USER, text="x")
+        try:
+            await dp.feed_update(bot, Update(update_id=1, message=message))
+        finally:
+            await bot.session.close()
+
+    with caplog.at_level(logging.INFO, logger="bot.updates"):
+        asyncio.run(run())
+
+    fields = [record.fields for record in caplog.records if record.getMessage() == "update"]
+    assert fields and fields[-1]["handler"] == "echo" and fields[-1]["step"] == "Form:phone"
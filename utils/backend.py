@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import random
+import ssl
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from utils.metrics import BACKEND_DURATION
+from utils.timings import timed
+
+OK_STATUSES = (200, 201, 204)
+RETRY_STATUSES = (502, 503, 504)
+
+logger = logging.getLogger(__name__)
+
+
+def get_ssl():
+    ssl_context = ssl.create_default_context()
+    ssl_context.check_hostname = False
+    ssl_context.verify_mode = ssl.CERT_NONE
+    return ssl_context
+
+
+class CircuitOpenError(aiohttp.ClientError):
+    """The endpoint failed too often just now; the request was not sent."""
+
+
+class CircuitBreaker:
+    """
+    Opens after ``threshold`` failures in a row. Once ``reset_timeout``
+    has passed, one trial request is let through. If it succeeds the
+    breaker closes, and if it fails the breaker opens again.
+    """
+
+    def __init__(self, threshold: int = 5, reset_timeout: float = 30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            # Half-open: this caller is the trial, everyone else keeps failing fast
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+class BackendClient:
+    """
+    Shared aiohttp session for all BACK_END_URL requests, so connections
+    (and their TLS handshakes) are kept alive and reused between clicks.
+
+    Every request goes through a circuit breaker per endpoint
+    (``"GET /api/patient/"``). GETs are retried with jittered backoff.
+    ``timeouts`` and ``hedge`` are keyed by endpoint prefix. With ``hedge``,
+    a second identical GET is sent if the first is slower than the given
+    number of seconds, and the first answer wins.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        timeout: float = 10,
+        limit_per_host: int = 20,
+        keepalive_timeout: float = 30,
+        dns_ttl: int = 300,
+        retries: int = 2,
+        retry_backoff: float = 0.2,
+        breaker_threshold: int = 5,
+        breaker_reset: float = 30,
+        timeouts: Optional[Dict[str, float]] = None,
+        hedge: Optional[Dict[str, float]] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_ttl = dns_ttl
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.timeouts = {endpoint: float(value) for endpoint, value in (timeouts or {}).items()}
+        self.hedge = {endpoint: float(value) for endpoint, value in (hedge or {}).items()}
+
+        self._ssl = get_ssl()
+        self._session: aiohttp.ClientSession = None
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                ssl=self._ssl,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_ttl,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=self.timeout
+            )
+        return self._session
+
+    async def start(self):
+        self.session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @staticmethod
+    def _lookup(settings: Dict[str, float], endpoint: str) -> Optional[float]:
+        matches = [prefix for prefix in settings if endpoint.startswith(prefix)]
+        return settings[max(matches, key=len)] if matches else None
+
+    def _breaker(self, endpoint: str) -> CircuitBreaker:
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = self._breakers[endpoint] = CircuitBreaker(self.breaker_threshold, self.breaker_reset)
+        return breaker
+
+    async def _send(self, method: str, path: str, **kwargs):
+        endpoint = f"{method} {urlsplit(path).path}"
+        started = time.perf_counter()
+        status = "error"
+        try:
+            with timed("backend"):
+                async with self.session.request(method, f"{self.base_url}{path}", **kwargs) as response:
+                    status = response.status
+                    data = None
+                    if response.status in OK_STATUSES:
+                        data = await response.json()
+            return response.status, data
+        except asyncio.CancelledError:
+            # The other hedged request won (or the caller gave up): not a backend error
+            status = "cancelled"
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            if status != "cancelled":
+                BACKEND_DURATION.observe(elapsed, endpoint=endpoint, status=status)
+            logger.debug(
+                "backend call",
+                extra={"fields": {"endpoint": endpoint, "status": status, "duration_ms": round(elapsed * 1000, 1)}},
+            )
+
+    async def _hedged(self, hedge_after: Optional[float], method: str, path: str, **kwargs):
+        if hedge_after is None:
+            return await self._send(method, path, **kwargs)
+
+        tasks = {asyncio.create_task(self._send(method, path, **kwargs))}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                tasks.add(asyncio.create_task(self._send(method, path, **kwargs)))
+
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def request(self, method: str, path: str, **kwargs):
+        """
+        Returns ``(status, data)``; ``data`` is the decoded JSON body for
+        successful responses and ``None`` otherwise.
+
+        Raises :class:`CircuitOpenError` (an ``aiohttp.ClientError``) without
+        sending anything while the endpoint's breaker is open.
+        """
+        endpoint = f"{method} {urlsplit(path).path}"
+        breaker = self._breaker(endpoint)
+
+        timeout = self._lookup(self.timeouts, endpoint)
+        if timeout is not None:
+            kwargs.setdefault("timeout", aiohttp.ClientTimeout(total=timeout))
+        hedge_after = self._lookup(self.hedge, endpoint) if method == "GET" else None
+
+        attempts = 1 + (self.retries if method == "GET" else 0)
+        for attempt in range(1, attempts + 1):
+            if not breaker.allow():
+                if attempt == 1:
+                    raise CircuitOpenError(f"{endpoint} is failing, not calling it for now")
+                # Our own failures opened it: report the last real outcome
+                if error is not None:
+                    raise error
+                return status, data
+
+            error = None
+            try:
+                status, data = await self._hedged(hedge_after, method, path, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as err:
+                breaker.failure()
+                if attempt == attempts:
+                    raise
+                error = err
+                logger.warning(f"{endpoint} failed ({err!r}), retry {attempt}/{self.retries}")
+            else:
+                if status not in RETRY_STATUSES:
+                    breaker.success()
+                    return status, data
+                breaker.failure()
+                if attempt == attempts:
+                    return status, data
+                logger.warning(f"{endpoint} answered {status}, retry {attempt}/{self.retries}")
+
+            # Full jitter, so retries from many users don't arrive together
+            await asyncio.sleep(random.uniform(0, self.retry_backoff * 2 ** (attempt - 1)))
+
+    async def get(self, path: str, **kwargs):
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs):
+        return await self.request("POST", path, **kwargs)
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from playwright.async_api import Browser, Page, Playwright, async_playwright
+
+
+class BrowserPool:
+    """
+    Keeps one warm Chromium process and leases an isolated browser context
+    (with a single page) to every render.
+
+    :param size: how many renders may run at the same time
+    :param max_renders: relaunch the browser after this many renders
+    """
+
+    def __init__(self, size: int = 2, max_renders: int = 200, launch_args=None):
+        self.size = size
+        self.max_renders = max_renders
+        self.launch_args = launch_args or ["--no-sandbox"]
+
+        self._semaphore = asyncio.Semaphore(size)
+        self._lock = asyncio.Lock()
+        self._playwright: Playwright = None
+        self._browser: Browser = None
+        self._renders = 0
+        self._leases = {}
+
+    async def start(self):
+        # Warm-up only: if it fails here, the first lease will try again
+        async with self._lock:
+            try:
+                await self._ensure_browser()
+            except Exception as err:
+                logging.exception(err)
+
+    async def stop(self):
+        async with self._lock:
+            browsers = list(self._leases)
+            if self._browser and self._browser not in self._leases:
+                browsers.append(self._browser)
+            for browser in browsers:
+                await self._close(browser)
+            self._leases.clear()
+            self._browser = None
+            if self._playwright:
+                await self._playwright.stop()
+                self._playwright = None
+
+    async def _launch(self):
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(
+            headless=True, args=self.launch_args
+        )
+        self._renders = 0
+        logging.info("Chromium launched for PDF rendering")
+
+    async def _ensure_browser(self) -> Browser:
+        browser = self._browser
+
+        # Health check: a crashed browser is replaced right away
+        if browser is None or not browser.is_connected():
+            await self._launch()
+
+        # Recycle a long-lived browser; the old one is closed when its last lease ends
+        elif self._renders >= self.max_renders:
+            if not self._leases.get(browser):
+                await self._close(browser)
+            await self._launch()
+
+        return self._browser
+
+    async def _close(self, target):
+        try:
+            await target.close()
+        except Exception as err:
+            logging.exception(err)
+
+    async def _release(self, browser: Browser):
+        async with self._lock:
+            self._leases[browser] -= 1
+            if self._leases[browser] == 0:
+                del self._leases[browser]
+                if browser is not self._browser:
+                    await self._close(browser)
+
+    @asynccontextmanager
+    async def page(self) -> Page:
+        """
+        Lease a fresh page. The context is closed when the block exits.
+        """
+        async with self._semaphore:
+            async with self._lock:
+                browser = await self._ensure_browser()
+                self._renders += 1
+                self._leases[browser] = self._leases.get(browser, 0) + 1
+
+            try:
+                context = await browser.new_context()
+                try:
+                    yield await context.new_page()
+                finally:
+                    await self._close(context)
+            finally:
+                await self._release(browser)
@@ -0,0 +1,102 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from utils.metrics import CACHE_REQUESTS
+
+_MISSING = object()
+
+
+class _LoadCancelled(Exception):
+    """The task loading a key was cancelled; its waiters load it themselves."""
+
+
+class TTLCache:
+    """
+    Small in-process cache shared by all users.
+
+    Entries expire after ``ttl`` seconds, the least recently used entry is
+    evicted once ``maxsize`` is reached, and concurrent misses for the same
+    key wait for a single load instead of each calling the backend. Hits
+    and misses are counted under ``name`` in ``bot_cache_requests_total``.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 1024, name: str = "cache"):
+        self.ttl = ttl
+        self.name = name
+        self.maxsize = maxsize
+        self._items: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._loading = {}
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._items.get(key)
+        if item is not None and item[0] < time.monotonic():
+            del self._items[key]
+            item = None
+
+        CACHE_REQUESTS.inc(cache=self.name, result="miss" if item is None else "hit")
+        if item is None:
+            return default
+
+        self._items.move_to_end(key)
+        return item[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self._items[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._items.pop(key, None)
+        # A load already in flight may have read the old value: don't cache it
+        self._loading.pop(key, None)
+
+    def clear(self) -> None:
+        self._items.clear()
+        # Same as invalidate(): loads in flight must not write old values back
+        self._loading.clear()
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the cached value or ``await loader()``. ``None`` results and
+        exceptions are passed to every waiter but not cached. If the task
+        doing the load is cancelled, a waiter takes the load over.
+        """
+        while True:
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+
+            future = self._loading.get(key)
+            if future is None:
+                break
+            try:
+                return await asyncio.shield(future)
+            except _LoadCancelled:
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.set_exception(_LoadCancelled())
+            future.exception()  # retrieved here; waiters retry instead of failing
+            raise
+        except Exception as err:
+            future.set_exception(err)
+            future.exception()  # waiters re-raise it; don't log it as unretrieved
+            raise
+        else:
+            if value is not None and self._loading.get(key) is future:
+                self.set(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            if self._loading.get(key) is future:
+                del self._loading[key]
@@ -0,0 +1,59 @@
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Type
+
+from aiogram.filters.callback_data import CallbackData
+
+CallbackHandler = Callable[..., Awaitable]
+
+
+class CallbackDispatcher:
+    """
+    Routes a callback query to its action handler with one dict lookup,
+    however many actions are registered.
+
+    Plain buttons are matched by their exact data (``cart``); structured
+    buttons by the prefix of their ``CallbackData`` factory (``doctor:42``),
+    which is unpacked and passed to the handler.
+    """
+
+    def __init__(self):
+        self._actions: Dict[str, CallbackHandler] = {}
+        self._factories: Dict[str, Tuple[Type[CallbackData], CallbackHandler]] = {}
+        self._fallback: Optional[CallbackHandler] = None
+
+    def action(self, *names: str):
+        def decorator(handler: CallbackHandler) -> CallbackHandler:
+            for name in names:
+                self._actions[name] = handler
+            return handler
+
+        return decorator
+
+    def factory(self, callback_data: Type[CallbackData]):
+        def decorator(handler: CallbackHandler) -> CallbackHandler:
+            self._factories[callback_data.__prefix__] = (callback_data, handler)
+            return handler
+
+        return decorator
+
+    def fallback(self, handler: CallbackHandler) -> CallbackHandler:
+        self._fallback = handler
+        return handler
+
+    def resolve(self, data: Optional[str]) -> Tuple[Optional[CallbackHandler], Optional[CallbackData]]:
+        if not data:
+            return None, None
+
+        handler = self._actions.get(data)
+        if handler is not None:
+            return handler, None
+
+        entry = self._factories.get(data.split(":", 1)[0])
+        if entry is not None:
+            callback_data, handler = entry
+            try:
+                return handler, callback_data.unpack(data)
+            except (TypeError, ValueError):
+                # Stale button from an older keyboard layout
+                return None, None
+
+        return self._fallback, None
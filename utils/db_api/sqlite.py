@@ -0,0 +1,133 @@
+import asyncio
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (
+    BaseStorage,
+    DefaultKeyBuilder,
+    KeyBuilder,
+    StateType,
+    StorageKey,
+)
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM storage kept in a local SQLite database (WAL mode), so user state
+    survives restarts and can be shared by several bot processes on one host.
+
+    All queries run on one background thread so the event loop never blocks
+    on disk I/O. Records not written for ``ttl`` seconds are treated as
+    missing and purged periodically.
+    """
+
+    PURGE_INTERVAL = 600
+
+    def __init__(
+        self,
+        path: str,
+        ttl: Optional[int] = None,
+        key_builder: Optional[KeyBuilder] = None,
+    ) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-sqlite")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._last_purge = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            "key TEXT PRIMARY KEY, state TEXT, data TEXT, updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS fsm_updated_at ON fsm (updated_at)")
+        conn.commit()
+        return conn
+
+    def _expired_before(self) -> float:
+        return time.time() - self.ttl if self.ttl else 0.0
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        if not self.ttl or now - self._last_purge < self.PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        self._conn.execute("DELETE FROM fsm WHERE updated_at < ?", (self._expired_before(),))
+
+    def _read(self, column: str, key: str) -> Optional[str]:
+        if self._conn is None:
+            self._conn = self._connect()
+        row = self._conn.execute(
+            f"SELECT {column} FROM fsm WHERE key = ? AND updated_at >= ?",
+            (key, self._expired_before()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def _write(self, column: str, key: str, value: Optional[str]) -> None:
+        if self._conn is None:
+            self._conn = self._connect()
+        self._conn.execute(
+            f"INSERT INTO fsm (key, {column}, updated_at) VALUES (?, ?, ?) "
+            f"ON CONFLICT(key) DO UPDATE SET {column} = excluded.{column}, "
+            "updated_at = excluded.updated_at",
+            (key, value, time.time()),
+        )
+        # Drop records that were cleared completely (state.clear())
+        self._conn.execute(
+            "DELETE FROM fsm WHERE key = ? AND state IS NULL AND (data IS NULL OR data = '{}')",
+            (key,),
+        )
+        self._purge()
+        self._conn.commit()
+
+    def _try_lock(self, key: str, ttl: float) -> bool:
+        if self._conn is None:
+            self._conn = self._connect()
+        now = time.time()
+        # One statement, so it is atomic across every process using the file
+        cursor = self._conn.execute(
+            "INSERT INTO fsm (key, data, updated_at) VALUES (?, '{\"locked\": true}', ?) "
+            "ON CONFLICT(key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at "
+            "WHERE fsm.data IS NULL OR fsm.data = '{}' OR fsm.updated_at < ?",
+            (key, now, now - ttl),
+        )
+        self._conn.commit()
+        return cursor.rowcount > 0
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self._run(self._write, "state", self.key_builder.build(key), value)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self._run(self._read, "state", self.key_builder.build(key))
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        value = json.dumps(dict(data), ensure_ascii=False)
+        await self._run(self._write, "data", self.key_builder.build(key), value)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        value = await self._run(self._read, "data", self.key_builder.build(key))
+        return json.loads(value) if value else {}
+
+    async def try_lock(self, key: StorageKey, ttl: float) -> bool:
+        """Take ``key`` unless someone took it less than ``ttl`` seconds ago; released with ``set_data(key, {})``."""
+        return await self._run(self._try_lock, self.key_builder.build(key), ttl)
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=True)
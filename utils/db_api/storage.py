@@ -0,0 +1,160 @@
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncGenerator, Dict, Optional
+
+from aiogram.fsm.storage.base import BaseEventIsolation, BaseStorage, DefaultKeyBuilder, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage, SimpleEventIsolation
+
+from data import config
+from utils.db_api.sqlite import SQLiteStorage
+from utils.metrics import STORAGE_DURATION
+
+
+class MeasuredStorage(BaseStorage):
+    """Times every call to the wrapped storage in ``bot_fsm_storage_duration_seconds``."""
+
+    def __init__(self, storage: BaseStorage):
+        self.storage = storage
+
+    def __getattr__(self, name):
+        # create_isolation, redis, ... of the wrapped storage
+        if name == "storage":
+            raise AttributeError(name)
+        return getattr(self.storage, name)
+
+    async def set_state(self, key: StorageKey, state=None) -> None:
+        with STORAGE_DURATION.time(operation="set_state"):
+            await self.storage.set_state(key, state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        with STORAGE_DURATION.time(operation="get_state"):
+            return await self.storage.get_state(key)
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        with STORAGE_DURATION.time(operation="set_data"):
+            await self.storage.set_data(key, data)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        with STORAGE_DURATION.time(operation="get_data"):
+            return await self.storage.get_data(key)
+
+    async def close(self) -> None:
+        await self.storage.close()
+
+
+def build_storage() -> BaseStorage:
+    """
+    FSM storage selected by ``FSM_STORAGE``: ``sqlite`` (default), ``redis`` or ``memory``,
+    wrapped in :class:`MeasuredStorage` when metrics are served.
+    """
+    storage = _build_storage(config.FSM_STORAGE)
+    return MeasuredStorage(storage) if config.METRICS_PORT else storage
+
+
+def _build_storage(backend: str) -> BaseStorage:
+    if backend == "memory":
+        return MemoryStorage()
+
+    if backend == "redis":
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError as err:
+            raise RuntimeError("FSM_STORAGE=redis requires the 'redis' package") from err
+
+        return RedisStorage.from_url(
+            config.REDIS_URL,
+            key_builder=DefaultKeyBuilder(with_bot_id=True, with_destiny=True),
+            state_ttl=config.FSM_TTL or None,
+            data_ttl=config.FSM_TTL or None,
+        )
+
+    if backend == "sqlite":
+        return SQLiteStorage(config.FSM_SQLITE_PATH, ttl=config.FSM_TTL)
+
+    raise ValueError(f"Unknown FSM_STORAGE: {backend!r}")
+
+
+async def try_lock(storage: BaseStorage, key: StorageKey, ttl: float) -> bool:
+    """
+    Lock kept in the FSM storage itself, so it holds across bot processes:
+    SQLite and Redis take it atomically, memory storage has one process
+    only. It expires after ``ttl`` seconds; release it with
+    ``storage.set_data(key, {})``.
+    """
+    lock_storage = storage.storage if isinstance(storage, MeasuredStorage) else storage
+    if hasattr(lock_storage, "try_lock"):
+        return await lock_storage.try_lock(key, ttl)
+
+    redis = getattr(lock_storage, "redis", None)
+    if redis is not None:
+        name = lock_storage.key_builder.build(key, "data")
+        return bool(await redis.set(name, '{"locked": true}', nx=True, ex=max(int(ttl), 1)))
+
+    # MemoryStorage: nothing is awaited between the check and the write
+    data = await lock_storage.get_data(key)
+    if data.get("locked_at", 0) > time.time() - ttl:
+        return False
+    await lock_storage.set_data(key, {"locked_at": time.time()})
+    return True
+
+
+_dropped: ContextVar[bool] = ContextVar("update_dropped", default=False)
+
+
+def update_dropped() -> bool:
+    """True while handling an update that :class:`BoundedIsolation` turned away."""
+    return _dropped.get()
+
+
+class BoundedIsolation(BaseEventIsolation):
+    """
+    Lets at most ``max_pending`` updates of one user run or wait for the
+    wrapped isolation's lock. Each waiting update holds one of the
+    ``tasks_concurrency_limit`` polling slots, so without a cap one user
+    tapping during a long render could hold all of them. Updates over the
+    cap don't wait: they pass through without the lock, marked with
+    :func:`update_dropped`, and ``UpdateLoggingMiddleware`` skips them.
+    """
+
+    def __init__(self, isolation: BaseEventIsolation, max_pending: int):
+        self.isolation = isolation
+        self.max_pending = max_pending
+        self._pending: Dict[StorageKey, int] = {}
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        pending = self._pending.get(key, 0)
+        if pending >= self.max_pending:
+            token = _dropped.set(True)
+            try:
+                yield
+            finally:
+                _dropped.reset(token)
+            return
+
+        self._pending[key] = pending + 1
+        try:
+            async with self.isolation.lock(key):
+                yield
+        finally:
+            self._pending[key] -= 1
+            if not self._pending[key]:
+                del self._pending[key]
+
+    async def close(self) -> None:
+        await self.isolation.close()
+
+
+def build_isolation(storage: BaseStorage) -> BaseEventIsolation:
+    """
+    Per-user lock around update handling, so concurrent handling never runs
+    two updates of the same user at once. Redis storage locks in Redis
+    (shared by all bot workers), anything else locks in this process.
+    At most UPDATES_PER_USER updates of a user are kept pending.
+    """
+    create_isolation = getattr(storage, "create_isolation", None)
+    isolation = create_isolation() if create_isolation is not None else SimpleEventIsolation()
+    if config.UPDATES_PER_USER:
+        return BoundedIsolation(isolation, config.UPDATES_PER_USER)
+    return isolation
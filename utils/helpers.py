@@ -1,7 +1,6 @@
+from typing import Optional
 
-from locales.en import EN
-from locales.uz import UZ
-from locales.ru import RU
+from utils.translations import KEY_LABELS, LOCALES, translate
 
 def get_full_name(user, isShort = False, withoutSurname = False):
     def get_attr(obj, attr):
@@ -35,8 +34,25 @@ def get_safe_attribute(obj, attr, default = "Неизвестно", number = Fal
 
 
 
-JSON_DATA = {"uz": UZ, "ru": RU, 'en': EN}
+def normalize_phone(phone) -> Optional[str]:
+    """
+    '+998 90 123-45-67', '998901234567' and '901234567' -> '998901234567'.
+    Anything that is not a full 12-digit number gives ``None``.
+    """
+    digits = "".join(char for char in str(phone or "") if char.isdigit())
+    if len(digits) == 9:
+        digits = "998" + digits
+    return digits if len(digits) == 12 else None
+
+
+JSON_DATA = LOCALES
 
 
 def get_translation(lang, message):
-    return JSON_DATA.get(lang, "ru").get(message) or ""
+    # Unknown language -> ru, missing key -> ru text -> the key itself
+    return translate(lang, message)
+
+
+def get_labels(message):
+    """All translations of ``message``, used to match reply-keyboard buttons."""
+    return KEY_LABELS.get(message, frozenset())
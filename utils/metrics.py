@@ -0,0 +1,243 @@
+"""
+Counters, histograms and gauges in the Prometheus text format.
+
+A small registry of our own rather than a client library: the bot runs as
+one asyncio process, so there are no threads or worker processes to
+aggregate. Metrics are declared at the bottom of this module and served by
+:func:`start_metrics_server` on ``/metrics``.
+"""
+import bisect
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+from data import config
+
+INF_BUCKET = 'le="+Inf"'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(Metric):
+    """Set directly, or computed on every scrape with ``function``."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labels=(), function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labels)
+        self.function = function
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self.function is not None:
+            return [f"{self.name} {_format_value(self.function())}"]
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> (count per bucket, sum, count)
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self._values.get(key)
+        if series is None:
+            series = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def time(self, **labels) -> "_Timer":
+        return _Timer(self, labels)
+
+    def samples(self):
+        lines = []
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f'{self.name}_bucket{_format_labels(self.labels, key, INF_BUCKET)} {count}')
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics.values() for line in metric.render()) + "\n"
+
+
+class ActiveUsers:
+    """Distinct users seen in the last ``window`` seconds."""
+
+    def __init__(self, window: float = 300):
+        self.window = window
+        self._seen: Dict[int, float] = {}
+
+    def seen(self, user_id: int):
+        # Re-inserting keeps the dict ordered by last activity
+        self._seen.pop(user_id, None)
+        self._seen[user_id] = time.monotonic()
+
+    def count(self) -> int:
+        cutoff = time.monotonic() - self.window
+        for user_id, seen_at in list(self._seen.items()):
+            if seen_at >= cutoff:
+                break
+            del self._seen[user_id]
+        return len(self._seen)
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    async def metrics(request: web.Request) -> web.Response:
+        return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError:
+        await runner.cleanup()
+        raise
+    return runner
+
+
+REGISTRY = Registry()
+
+UPDATES = REGISTRY.counter(
+    "bot_updates_total", "Updates handled, by update type, handler and outcome", ("type", "handler", "status")
+)
+UPDATE_DURATION = REGISTRY.histogram(
+    "bot_update_duration_seconds", "Time to handle an update end to end", ("type", "handler")
+)
+CALLBACK_ACTIONS = REGISTRY.counter("bot_callback_actions_total", "Callback buttons pressed, by action", ("action",))
+
+BACKEND_DURATION = REGISTRY.histogram(
+    "bot_backend_request_duration_seconds", "Backend requests by endpoint and HTTP status", ("endpoint", "status")
+)
+
+RENDER_DURATION = REGISTRY.histogram(
+    "bot_render_duration_seconds", "PDF render time, by where it ran and its outcome", ("mode", "status")
+)
+
+RENDER_QUEUE_DEPTH = REGISTRY.gauge("bot_render_queue_depth", "Renders waiting for a free render slot")
+RENDERS_RUNNING = REGISTRY.gauge("bot_renders_running", "Renders in progress")
+
+CACHE_REQUESTS = REGISTRY.counter("bot_cache_requests_total", "Cache lookups by cache and result", ("cache", "result"))
+
+STORAGE_DURATION = REGISTRY.histogram(
+    "bot_fsm_storage_duration_seconds",
+    "FSM storage calls by operation",
+    ("operation",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+
+active_users = ActiveUsers(config.ACTIVE_USERS_WINDOW)
+ACTIVE_USERS = REGISTRY.gauge(
+    "bot_active_users", "Distinct users with an update in the last ACTIVE_USERS_WINDOW seconds", function=active_users.count
+)
@@ -1,6 +1,57 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
+from datetime import datetime, timezone
 
-logging.basicConfig(format=u'%(filename)s [LINE:%(lineno)d] #%(levelname)-8s [%(asctime)s]  %(message)s',
-                    level=logging.INFO,
-                    # level=logging.DEBUG,  # Можно заменить на другой уровень логгирования.
-                    )
+from data import config
+
+TEXT_FORMAT = u'%(filename)s [LINE:%(lineno)d] #%(levelname)-8s [%(asctime)s]  %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line. Structured fields are passed as
+    ``logger.info("update", extra={"fields": {...}})``.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        payload.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def setup_logging(level: str = "INFO", levels: dict = None, fmt: str = "json"):
+    """
+    Records are formatted where they are logged and written to stdout by a
+    QueueListener thread, so handlers never block on the terminal.
+    ``levels`` sets the level per logger, e.g. ``{"aiogram.event": "WARNING"}``.
+    """
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter("%(message)s"))
+
+    records = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(records)
+    handler.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level.upper())
+    for name, name_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(str(name_level).upper())
+
+    listener = logging.handlers.QueueListener(records, stream)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+setup_logging(config.LOG_LEVEL, config.LOG_LEVELS, config.LOG_FORMAT)
@@ -1,9 +1,12 @@
-def rate_limit(limit: int, key=None):
+def rate_limit(limit: float, key=None, burst: int = 1):
     """
     Decorator for configuring rate limit and key in different functions.
 
-    :param limit:
-    :param key:
+    Sets the ``rate_limit`` handler flag read by ``ThrottlingMiddleware``.
+
+    :param limit: seconds per call
+    :param key: bucket name, handlers with the same key share one limit
+    :param burst: calls allowed in a row before the limit applies
     :return:
     """
 
@@ -11,6 +14,12 @@ def rate_limit(limit: int, key=None):
         setattr(func, 'throttling_rate_limit', limit)
         if key:
             setattr(func, 'throttling_key', key)
+
+        flags = getattr(func, 'aiogram_flag', {})
+        func.aiogram_flag = {
+            **flags,
+            'rate_limit': {'limit': limit, 'key': key or func.__name__, 'burst': burst},
+        }
         return func
 
     return decorator
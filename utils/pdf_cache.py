@@ -0,0 +1,155 @@
+import asyncio
+import hashlib
+import os
+import time
+from typing import Iterable, List, Optional
+
+from utils.metrics import CACHE_REQUESTS
+
+
+class PdfCache:
+    """
+    Rendered result PDFs on disk, and the Telegram ``file_id`` of each one
+    after its first upload, so a repeated request is answered without
+    rendering or uploading again.
+
+    A file's mtime is when it was stored (used for ``ttl``) and its atime
+    when it was last used (used for LRU eviction once ``max_bytes`` of
+    PDFs are kept).
+
+    Results are refreshed in two ways. Entries expire after ``ttl``
+    (PDF_CACHE_TTL), which bounds how stale a result can get. When results
+    change, :meth:`invalidate_results` drops them by guid and by service
+    id at once; admins reach it with ``/clear_results``.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl: float):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+    @staticmethod
+    def key(guid: Optional[str] = None, service_ids=None) -> str:
+        if guid:
+            return f"guid:{guid}"
+        return "services:" + ",".join(sorted({str(service_id) for service_id in service_ids}))
+
+    def _path(self, key: str, suffix: str) -> str:
+        name = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.directory, f"{name}{suffix}")
+
+    def _read(self, path: str, mode: str):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+
+        if stat.st_mtime + self.ttl < time.time():
+            self._remove(path)
+            return None
+
+        with open(path, mode) as file:
+            value = file.read()
+        os.utime(path, (time.time(), stat.st_mtime))
+        return value
+
+    def _write(self, path: str, mode: str, value):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, mode) as file:
+            file.write(value)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.directory):
+            stat = entry.stat()
+            if stat.st_mtime + self.ttl < now:
+                self._remove(entry.path)
+            elif entry.name.endswith(".pdf"):
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def _put_pdf(self, key: str, pdf: bytes):
+        self._write(self._path(key, ".pdf"), "wb", pdf)
+        # File names are hashes: keep the key so service sets can be found by service id
+        self._write(self._path(key, ".key"), "w", key)
+        self._evict()
+
+    def _remove_key(self, key: str):
+        for suffix in (".pdf", ".file_id", ".key"):
+            self._remove(self._path(key, suffix))
+
+    def _service_keys(self, service_ids: Iterable) -> List[str]:
+        ids = {str(service_id) for service_id in service_ids}
+        keys = []
+        if not os.path.isdir(self.directory):
+            return keys
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".key"):
+                continue
+            try:
+                with open(entry.path) as file:
+                    key = file.read()
+            except FileNotFoundError:
+                continue
+            if key.startswith("services:") and ids & set(key[len("services:"):].split(",")):
+                keys.append(key)
+        return keys
+
+    async def get_file_id(self, key: str) -> Optional[str]:
+        file_id = await asyncio.to_thread(self._read, self._path(key, ".file_id"), "r")
+        CACHE_REQUESTS.inc(cache="pdf_file_id", result="miss" if file_id is None else "hit")
+        return file_id
+
+    async def set_file_id(self, key: str, file_id: str):
+        await asyncio.to_thread(self._write, self._path(key, ".file_id"), "w", file_id)
+
+    async def get_pdf(self, key: str) -> Optional[bytes]:
+        pdf = await asyncio.to_thread(self._read, self._path(key, ".pdf"), "rb")
+        CACHE_REQUESTS.inc(cache="pdf", result="miss" if pdf is None else "hit")
+        return pdf
+
+    async def put_pdf(self, key: str, pdf: bytes):
+        await asyncio.to_thread(self._put_pdf, key, pdf)
+
+    async def invalidate(self, key: str):
+        """Forget one cached result."""
+        await asyncio.to_thread(self._remove_key, key)
+
+    async def invalidate_results(self, guid: Optional[str] = None, service_ids: Iterable = ()) -> int:
+        """
+        Forget the result of admittance ``guid`` and every cached service
+        set that contains one of ``service_ids``. Returns how many were dropped.
+        """
+
+        def invalidate():
+            keys = [self.key(guid=guid)] if guid else []
+            keys += self._service_keys(service_ids)
+            for key in keys:
+                self._remove_key(key)
+            return len(keys)
+
+        return await asyncio.to_thread(invalidate)
+
+    async def clear(self):
+        def clear():
+            if os.path.isdir(self.directory):
+                for entry in os.scandir(self.directory):
+                    self._remove(entry.path)
+
+        await asyncio.to_thread(clear)
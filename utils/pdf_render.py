@@ -0,0 +1,39 @@
+"""
+Results page → PDF, shared by the bot (single-process mode) and
+``render_worker.py``. Nothing here imports ``loader``.
+"""
+import json
+import logging
+from typing import Optional
+
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from data import config
+from utils.browser_pool import BrowserPool
+
+# The results page sets window.<PDF_READY_FLAG> = true (or renders PDF_READY_SELECTOR)
+# once its data is loaded; PDF_READY_TIMEOUT is only a fallback for pages that never do.
+READY_CHECK = (
+    f"() => window[{json.dumps(config.PDF_READY_FLAG)}] === true"
+    f" || document.querySelector({json.dumps(config.PDF_READY_SELECTOR)}) !== null"
+)
+
+
+async def wait_until_ready(page):
+    try:
+        await page.wait_for_function(READY_CHECK, timeout=config.PDF_READY_TIMEOUT * 1000)
+    except PlaywrightTimeoutError:
+        logging.warning(f"Results page gave no ready signal in {config.PDF_READY_TIMEOUT}s: {page.url}")
+
+
+def result_url(guid: Optional[str] = None, ids: Optional[str] = None) -> str:
+    if guid:
+        return f"{config.FRONT_END_URL}/results/{guid}"
+    return f"{config.FRONT_END_URL}/results?id={ids}"
+
+
+async def render_pdf(pool: BrowserPool, guid: Optional[str] = None, ids: Optional[str] = None) -> bytes:
+    async with pool.page() as page:
+        await page.goto(result_url(guid, ids), wait_until="networkidle")
+        await wait_until_ready(page)
+        return await page.pdf(format='A4', print_background=False)
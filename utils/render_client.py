@@ -0,0 +1,60 @@
+import itertools
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+
+
+class RenderWorkerError(aiohttp.ClientError):
+    """A render worker answered with something other than a PDF."""
+
+
+class RenderClient:
+    """
+    Sends renders to ``render_worker.py`` processes, round-robin.
+
+    ``urls`` are ``unix:/path/to.sock`` or ``http://host:port``. A worker
+    that cannot be reached is skipped; any other failure is raised as is,
+    so a slow or broken page is not rendered twice.
+    """
+
+    def __init__(self, urls: List[str], timeout: float = 60):
+        self.urls = list(urls)
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+
+        self._sessions: Dict[str, Tuple[aiohttp.ClientSession, str]] = {}
+        self._next = itertools.count()
+
+    def _session(self, url: str) -> Tuple[aiohttp.ClientSession, str]:
+        session, base_url = self._sessions.get(url, (None, None))
+        if session is None or session.closed:
+            if url.startswith("unix:"):
+                connector = aiohttp.UnixConnector(path=url[len("unix:"):])
+                base_url = "http://render-worker"
+            else:
+                connector = aiohttp.TCPConnector()
+                base_url = url.rstrip("/")
+            session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._sessions[url] = (session, base_url)
+        return session, base_url
+
+    async def close(self):
+        for session, _ in self._sessions.values():
+            await session.close()
+        self._sessions.clear()
+
+    async def render(self, guid: Optional[str] = None, ids: Optional[str] = None) -> bytes:
+        start = next(self._next)
+        error = None
+
+        for i in range(len(self.urls)):
+            url = self.urls[(start + i) % len(self.urls)]
+            session, base_url = self._session(url)
+            try:
+                async with session.post(f"{base_url}/render", json={"guid": guid, "ids": ids}) as response:
+                    if response.status != 200:
+                        raise RenderWorkerError(f"{url} answered {response.status}: {await response.text()}")
+                    return await response.read()
+            except aiohttp.ClientConnectionError as err:
+                error = err
+
+        raise error
@@ -0,0 +1,146 @@
+import asyncio
+import contextvars
+import logging
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Set
+
+from utils.metrics import RENDER_QUEUE_DEPTH, RENDERS_RUNNING
+
+logger = logging.getLogger(__name__)
+
+PositionCallback = Callable[[int], Awaitable]
+
+
+class QueueFullError(Exception):
+    """Too many renders are already waiting."""
+
+
+class RenderInProgressError(Exception):
+    """The same key already has a render queued or running."""
+
+
+class _Job:
+    def __init__(self, key: Hashable, render: Callable[[], Awaitable], on_position: Optional[PositionCallback]):
+        self.key = key
+        self.render = render
+        self.on_position = on_position
+        self.position = None
+        # The render runs in the context of whoever queued it (logging, timings)
+        self.context = contextvars.copy_context()
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class RenderQueue:
+    """
+    FIFO in front of PDF rendering: ``workers`` renders run at a time, at
+    most ``max_depth`` wait behind them, and each key (a user) may have
+    only one job at a time.
+
+    ``on_position(n)`` is called whenever a job's place in the queue
+    changes; ``0`` means its render has started.
+    """
+
+    def __init__(self, workers: int = 2, max_depth: int = 20):
+        self.workers = workers
+        self.max_depth = max_depth
+
+        self._queue: "asyncio.Queue[_Job]" = None
+        self._waiting: List[_Job] = []
+        self._jobs: Dict[Hashable, _Job] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._callbacks: Set[asyncio.Task] = set()
+
+    @property
+    def depth(self) -> int:
+        return len(self._waiting)
+
+    def is_pending(self, key: Hashable) -> bool:
+        return key in self._jobs
+
+    def _start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        tasks = [*self._tasks, *self._callbacks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+
+        for job in self._jobs.values():
+            job.future.cancel()
+        self._jobs.clear()
+        self._waiting.clear()
+        self._update_gauges()
+
+    async def run(self, key: Hashable, render: Callable[[], Awaitable], on_position: Optional[PositionCallback] = None):
+        """
+        Queue ``render()`` and wait for its result.
+
+        Raises :class:`RenderInProgressError` if ``key`` already has a job
+        and :class:`QueueFullError` if ``max_depth`` jobs are waiting.
+        """
+        if key in self._jobs:
+            raise RenderInProgressError(key)
+        if len(self._waiting) >= self.max_depth:
+            raise QueueFullError(key)
+
+        self._start()
+        job = _Job(key, render, on_position)
+        self._jobs[key] = job
+        self._waiting.append(job)
+        self._queue.put_nowait(job)
+        self._report_positions()
+
+        return await asyncio.shield(job.future)
+
+    def _update_gauges(self):
+        RENDER_QUEUE_DEPTH.set(len(self._waiting))
+        RENDERS_RUNNING.set(len(self._jobs) - len(self._waiting))
+
+    def _report_positions(self):
+        self._update_gauges()
+        for position, job in enumerate(self._waiting, start=1):
+            self._report(job, position)
+
+    def _report(self, job: _Job, position: int):
+        if job.on_position is None or job.position == position:
+            return
+        job.position = position
+        # Keep a reference until it is done, or the task may be garbage-collected mid-run
+        task = asyncio.create_task(self._call(job.on_position, position))
+        self._callbacks.add(task)
+        task.add_done_callback(self._callbacks.discard)
+
+    @staticmethod
+    async def _call(on_position: PositionCallback, position: int):
+        try:
+            await on_position(position)
+        except Exception as err:
+            logger.warning(f"Render queue position update failed: {err}")
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            self._waiting.remove(job)
+            self._report(job, 0)
+            self._report_positions()
+
+            try:
+                result = await job.context.run(asyncio.ensure_future, job.render())
+            except asyncio.CancelledError:
+                job.future.cancel()
+                raise
+            except Exception as err:
+                if not job.future.done():
+                    job.future.set_exception(err)
+                    job.future.exception()  # the user may have gone; don't log it as unretrieved
+            else:
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                self._jobs.pop(job.key, None)
+                self._update_gauges()
+                self._queue.task_done()
@@ -0,0 +1,140 @@
+"""
+Doctor timetable availability as int bitmaps.
+
+Bit ``i`` of a mask is the ``i``-th slot of the working day, so blocking a
+reserve is one shift-and-or and the free slots are ``~blocked & full``.
+A mask per (doctor, day) lets a whole week or many doctors be searched in
+one pass.
+"""
+import heapq
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def clock_minutes(value: str) -> int:
+    """'08:30' -> 510"""
+    hours, minutes = value.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def _parse(value) -> Optional[datetime]:
+    try:
+        # Wall-clock time as the backend sent it, like the old HH:MM labels
+        return datetime.fromisoformat(value).replace(tzinfo=None)
+    except (TypeError, ValueError):
+        return None
+
+
+class SlotGrid:
+    """
+    :param day_start: first slot, minutes after midnight
+    :param day_end: end of the last slot, minutes after midnight
+    :param slot_minutes: slot length
+    """
+
+    def __init__(self, day_start: int = 8 * 60, day_end: int = 18 * 60, slot_minutes: int = 30):
+        if not (0 <= day_start < day_end <= MINUTES_PER_DAY) or slot_minutes <= 0:
+            raise ValueError("Working hours must be within one day and slot_minutes positive")
+
+        self.day_start = day_start
+        self.slot_minutes = slot_minutes
+        self.size = (day_end - day_start) // slot_minutes
+        self.full = (1 << self.size) - 1
+
+    def slot_time(self, index: int) -> time:
+        minutes = self.day_start + index * self.slot_minutes
+        return time(minutes // 60, minutes % 60)
+
+    def _minutes(self, value: datetime, day: Optional[date], ceil: bool = False) -> int:
+        """Minutes after midnight of ``day``; ``ceil`` rounds any seconds up to the next minute."""
+        days = (value.date() - day).days if day else 0
+        minutes = days * MINUTES_PER_DAY + value.hour * 60 + value.minute
+        if ceil and (value.second or value.microsecond):
+            minutes += 1
+        return minutes
+
+    def range_mask(self, start: int, end: int) -> int:
+        """Slots overlapping ``[start, end)``, both in minutes after midnight."""
+        first = max((start - self.day_start) // self.slot_minutes, 0)
+        last = min(-(-(end - self.day_start) // self.slot_minutes), self.size)
+        if last <= first:
+            return 0
+        return ((1 << (last - first)) - 1) << first
+
+    def blocked_mask(self, reserves: List[Dict], services: List[Dict], day: Optional[date] = None) -> int:
+        """
+        Slots taken by ``services`` (the slot holding their registrationDate)
+        and by ``reserves`` (every slot overlapping start..end). Without
+        ``day`` only the time of day is looked at.
+        """
+        mask = 0
+
+        for service in services:
+            registered = _parse(service.get("registrationDate"))
+            if registered:
+                minute = self._minutes(registered, day)
+                mask |= self.range_mask(minute, minute + 1)
+
+        for reserve in reserves:
+            start, end = _parse(reserve.get("start")), _parse(reserve.get("end"))
+            if start and end and end > start:
+                # Start floored, end rounded up: 14:00-14:30:15 still overlaps the 14:30 slot
+                mask |= self.range_mask(self._minutes(start, day), self._minutes(end, day, ceil=True))
+
+        return mask & self.full
+
+    def free_mask(self, reserves: List[Dict], services: List[Dict], day: Optional[date] = None) -> int:
+        return ~self.blocked_mask(reserves, services, day) & self.full
+
+    def after_mask(self, moment: datetime, day: date) -> int:
+        """Slots of ``day`` that start at or after ``moment``."""
+        minute = self._minutes(moment, day)
+        first = max(-(-(minute - self.day_start) // self.slot_minutes), 0)
+        return self.full & ~((1 << min(first, self.size)) - 1)
+
+    @staticmethod
+    def indexes(mask: int) -> Iterator[int]:
+        while mask:
+            low = mask & -mask
+            yield low.bit_length() - 1
+            mask ^= low
+
+    def free_times(self, mask: int) -> List[time]:
+        return [self.slot_time(index) for index in self.indexes(mask)]
+
+    def availability(
+        self, timetables: Iterable[Tuple[Hashable, date, List[Dict], List[Dict]]]
+    ) -> Dict[Tuple[Hashable, date], int]:
+        """Free masks for many ``(doctor, day, reserves, services)`` at once."""
+        return {
+            (doctor, day): self.free_mask(reserves, services, day)
+            for doctor, day, reserves, services in timetables
+        }
+
+    def earliest_free(
+        self, free: Dict[Tuple[Hashable, date], int], count: int, not_before: Optional[datetime] = None
+    ) -> List[Tuple[Hashable, datetime]]:
+        """The ``count`` earliest free slots over all doctors and days, as (doctor, start)."""
+        slots = []
+        for (doctor, day), mask in free.items():
+            if not_before is not None:
+                mask &= self.after_mask(not_before, day)
+            # Each mask contributes at most ``count`` slots
+            for taken, index in enumerate(self.indexes(mask)):
+                if taken == count:
+                    break
+                slots.append((datetime.combine(day, self.slot_time(index)), doctor))
+
+        return [(doctor, start) for start, doctor in heapq.nsmallest(count, slots, key=lambda slot: slot[0])]
+
+    def next_free(
+        self, free: Dict[Tuple[Hashable, date], int], not_before: Optional[datetime] = None
+    ) -> Optional[Tuple[Hashable, datetime]]:
+        """Earliest free slot over all doctors and days, as (doctor, start)."""
+        slots = self.earliest_free(free, 1, not_before)
+        return slots[0] if slots else None
+
+def daterange(start: date, days: int) -> List[date]:
+    return [start + timedelta(days=offset) for offset in range(days)]
@@ -0,0 +1,50 @@
+"""
+Per-update timings.
+
+``UpdateLoggingMiddleware`` starts a record for every update; backend calls
+and PDF renders made while handling it add their durations with
+:func:`timed`. Outside an update (startup, background jobs) nothing is
+recorded.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+_record: ContextVar[Optional[Dict[str, Any]]] = ContextVar("update_record", default=None)
+
+
+def start_record(**fields):
+    """Start a new record for the current update; returns the token to reset it."""
+    return _record.set(dict(fields))
+
+
+def finish_record(token) -> Dict[str, Any]:
+    record = _record.get()
+    _record.reset(token)
+    return record
+
+
+def annotate(**fields):
+    """Add fields (handler, step, status) to the current update's record."""
+    record = _record.get()
+    if record is not None:
+        record.update(fields)
+
+
+def add_duration(name: str, seconds: float):
+    record = _record.get()
+    if record is None:
+        return
+    record[f"{name}_ms"] = round(record.get(f"{name}_ms", 0) + seconds * 1000, 1)
+    record[f"{name}_calls"] = record.get(f"{name}_calls", 0) + 1
+
+
+@contextmanager
+def timed(name: str):
+    """``with timed("backend"): ...`` adds to ``backend_ms`` and ``backend_calls``."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_duration(name, time.perf_counter() - started)
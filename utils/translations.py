@@ -0,0 +1,105 @@
+"""
+Locales compiled once at import into one table per language.
+
+Every language holds every known key, filled in through the fallback chain
+``lang -> ru -> key``, so a lookup is a single dict access. Texts are
+interned because the same labels are compared on every incoming message.
+"""
+import ast
+import logging
+import os
+import sys
+from typing import Dict, FrozenSet, Set, Tuple
+
+from locales.en import EN
+from locales.ru import RU
+from locales.uz import UZ
+
+DEFAULT_LANGUAGE = "ru"
+LOCALES = {"uz": UZ, "ru": RU, "en": EN}
+
+# The project's own code; venv/ and other directories in the root are not scanned
+SOURCE_PATHS = ("app.py", "filters", "handlers", "keyboards", "middlewares", "utils")
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _compile(locales) -> Dict[str, Dict[str, str]]:
+    fallback = locales[DEFAULT_LANGUAGE]
+    keys = set().union(*locales.values())
+    return {
+        lang: {
+            sys.intern(key): sys.intern(texts.get(key) or fallback.get(key) or key)
+            for key in keys
+        }
+        for lang, texts in locales.items()
+    }
+
+
+TRANSLATIONS = _compile(LOCALES)
+
+# Every translation of a key
+KEY_LABELS: Dict[str, FrozenSet[str]] = {
+    key: frozenset(texts[key] for texts in TRANSLATIONS.values()) for key in TRANSLATIONS[DEFAULT_LANGUAGE]
+}
+
+
+def translate(lang, key) -> str:
+    return TRANSLATIONS.get(lang, TRANSLATIONS[DEFAULT_LANGUAGE]).get(key, key)
+
+
+def _source_files(root: str):
+    for source in SOURCE_PATHS:
+        path = os.path.join(root, source)
+        if os.path.isfile(path):
+            yield path
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames[:] = [name for name in dirnames if not name.startswith((".", "__"))]
+            yield from (os.path.join(dirpath, name) for name in filenames if name.endswith(".py"))
+
+
+def _source_strings(root: str) -> Tuple[Set[str], Set[str]]:
+    """String literals in SOURCE_PATHS, and keys passed to get_translation/get_labels."""
+    strings, lookups = set(), set()
+    for path in _source_files(root):
+        with open(path, encoding="utf-8") as file:
+            tree = ast.parse(file.read())
+
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Constant) and isinstance(node.value, str):
+                strings.add(node.value)
+            elif isinstance(node, ast.Call) and node.args:
+                name = getattr(node.func, "id", getattr(node.func, "attr", None))
+                key = node.args[-1]
+                if name in ("get_translation", "get_labels") and isinstance(key, ast.Constant):
+                    lookups.add(key.value)
+    return strings, lookups
+
+
+def check_locales(root: str = ROOT_DIR) -> Tuple[Dict[str, Set[str]], Set[str]]:
+    """
+    Missing keys per language (looked up in the code or defined in another
+    language, but not in this one) and orphaned keys (defined but never
+    mentioned in the code). Keys chosen at runtime, like ``'male' if ...``,
+    count as used because they still appear as string literals.
+    """
+    strings, lookups = _source_strings(root)
+    defined = set().union(*LOCALES.values())
+
+    missing = {lang: (defined | lookups) - set(texts) for lang, texts in LOCALES.items()}
+    orphaned = defined - strings
+    return {lang: keys for lang, keys in missing.items() if keys}, orphaned
+
+
+def report_locales(root: str = ROOT_DIR) -> bool:
+    missing, orphaned = check_locales(root)
+    for lang, keys in sorted(missing.items()):
+        logging.warning(f"Locale '{lang}' is missing keys: {', '.join(sorted(keys))}")
+    if orphaned:
+        logging.warning(f"Locale keys not used anywhere: {', '.join(sorted(orphaned))}")
+    return not missing and not orphaned
+
+
+if __name__ == "__main__":
+    # python -m utils.translations  - non-zero exit if locales have drifted
+    sys.exit(0 if report_locales() else 1)
@@ -0,0 +1,39 @@
+"""
+Compact projections of backend objects that are kept in per-user FSM data.
+
+Only ids and the fields the bot actually shows are stored; the nested shape
+is preserved so ``get_full_name`` / ``get_safe_attribute`` keep working.
+Full catalog pages stay in the shared cache.
+"""
+
+NAME_FIELDS = ("first_name", "last_name", "surname")
+
+
+def _names(obj):
+    obj = obj or {}
+    return {field: obj.get(field) for field in NAME_FIELDS}
+
+
+def doctor_view(doctor):
+    return {
+        "id": doctor["id"],
+        **_names(doctor),
+        "speciality": {"title": (doctor.get("speciality") or {}).get("title")},
+    }
+
+
+def admittance_type_view(admittance_type):
+    return {
+        "id": admittance_type["id"],
+        "title": admittance_type.get("title"),
+        "amount": admittance_type.get("amount"),
+    }
+
+
+def service_view(service):
+    return {
+        "id": service["id"],
+        "registrationDate": service.get("registrationDate"),
+        "admittanceType": {"title": (service.get("admittanceType") or {}).get("title")},
+        "doctor": _names(service.get("doctor")),
+    }